@@ -8,6 +8,10 @@ class UserProfileAdmin(admin.ModelAdmin):
     list_filter = ['user__is_active', 'user__is_staff']
     search_fields = ['user__username', 'user__email']
     readonly_fields = ['user']
+    list_select_related = ['user']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user')
     
     def has_profile_picture(self, obj):
         return bool(obj.profile_picture)
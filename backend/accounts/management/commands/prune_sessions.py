@@ -0,0 +1,42 @@
+"""
+Django management command to clean up the UserSession table.
+Should be run on schedule (e.g. nightly).
+"""
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.models import UserSession
+
+
+class Command(BaseCommand):
+    help = 'Delete orphaned user sessions and inactive sessions older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=30,
+            help='Delete inactive sessions with no activity in this many days (default: 30)',
+        )
+
+    def handle(self, *args, **options):
+        # UserSession.user has no DB-level constraint, so rows whose user was
+        # removed outside the ORM are left behind and must be swept here
+        User = get_user_model()
+        orphaned = UserSession.objects.exclude(user_id__in=User.objects.values('pk'))
+        orphaned_count, _ = orphaned.delete()
+
+        # Nothing references UserSession, so these deletes run as a single
+        # DELETE statement without loading the rows
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        stale = UserSession.objects.filter(is_active=False, last_activity__lt=cutoff)
+        stale_count, _ = stale.delete()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Deleted {orphaned_count} orphaned sessions and {stale_count} inactive sessions'
+            )
+        )
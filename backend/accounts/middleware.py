@@ -0,0 +1,24 @@
+"""
+Request middleware for session tracking.
+"""
+from django.utils.functional import SimpleLazyObject
+
+from accounts.utils import parse_user_agent
+
+
+class ParsedUserAgentMiddleware:
+    """
+    Attach the parsed User-Agent to the request as ``request.parsed_ua``.
+    
+    Parsing is deferred until first access, so requests that never look at it
+    pay nothing and every consumer within a request shares one parse.
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        request.parsed_ua = SimpleLazyObject(
+            lambda: parse_user_agent(request.META.get('HTTP_USER_AGENT', ''))
+        )
+        return self.get_response(request)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_rename_accounts_usersession_user_login_idx_accounts_us_user_id_b0e444_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='usersession',
+            name='token_jti',
+            field=models.CharField(max_length=255),
+        ),
+    ]
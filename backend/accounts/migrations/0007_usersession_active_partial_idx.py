@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_usersession_user_no_db_constraint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usersession',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user', '-login_date'], name='acc_us_active_user_partial_idx'),
+        ),
+    ]
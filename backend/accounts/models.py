@@ -1,18 +1,23 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.utils import timezone
+from functools import partial
 import os
 import uuid
 
 
+PROFILE_PICTURE_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png'})
+
+
 def profile_picture_upload_path(instance, filename):
     """Generate a secure upload path for profile pictures"""
     # Sanitize filename and add UUID to prevent collisions
     ext = os.path.splitext(filename)[1].lower()
     # Only allow image extensions
-    if ext not in ['.jpg', '.jpeg', '.png']:
+    if ext not in PROFILE_PICTURE_EXTENSIONS:
         ext = '.jpg'
     filename = f"{uuid.uuid4().hex}{ext}"
     return os.path.join('profile_pictures', filename)
@@ -33,11 +38,15 @@ class UserProfile(models.Model):
         return f"{self.user.username}'s Profile"
     
     def delete(self, *args, **kwargs):
-        """Delete the profile picture file when profile is deleted"""
-        if self.profile_picture:
-            if os.path.isfile(self.profile_picture.path):
-                os.remove(self.profile_picture.path)
-        super().delete(*args, **kwargs)
+        """Delete the profile picture file once the profile deletion is committed"""
+        picture = self.profile_picture
+        result = super().delete(*args, **kwargs)
+        if picture:
+            # Unlink after commit so the DB delete doesn't wait on storage and a
+            # rolled-back delete keeps its file. Storage.delete() tolerates a
+            # missing file, so no existence check first
+            transaction.on_commit(partial(picture.storage.delete, picture.name))
+        return result
 
 
 @receiver(post_save, sender=User)
@@ -47,17 +56,18 @@ def create_user_profile(sender, instance, created, **kwargs):
         UserProfile.objects.create(user=instance)
 
 
-@receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    """Automatically save the UserProfile when User is saved"""
-    if hasattr(instance, 'profile'):
-        instance.profile.save()
-
-
 class UserSession(models.Model):
     """Track active user sessions with device and browser information"""
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sessions')
-    token_jti = models.CharField(max_length=255, db_index=True)  # JWT token ID
+    # No DB-level FK constraint: session inserts skip the referential check and
+    # ORM user deletes still cascade; rows orphaned by raw deletes are swept by
+    # the prune_sessions management command
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='sessions',
+        db_constraint=False,
+    )
+    token_jti = models.CharField(max_length=255)  # JWT token ID (indexed via Meta.indexes)
     refresh_token_jti = models.CharField(max_length=255, null=True, blank=True)  # Refresh token ID
     ip_address = models.GenericIPAddressField()  # Real IP address
     user_agent = models.TextField()  # Raw User-Agent string
@@ -78,7 +88,17 @@ class UserSession(models.Model):
         indexes = [
             models.Index(fields=['user', '-login_date']),
             models.Index(fields=['token_jti']),
+            # Partial index: stays sized to live sessions as inactive history grows
+            models.Index(
+                fields=['user', '-login_date'],
+                name='acc_us_active_user_partial_idx',
+                condition=models.Q(is_active=True),
+            ),
         ]
     
     def __str__(self):
         return f"{self.user.username} - {self.browser_name} on {self.os_name} ({self.ip_address})"
+    
+    def touch(self):
+        """Record activity on this session, writing only last_activity"""
+        self.save(update_fields=['last_activity'])
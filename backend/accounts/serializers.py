@@ -1,9 +1,29 @@
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework import serializers
+from django.contrib.auth.models import User, update_last_login
 from accounts.models import UserSession
 from accounts.utils import get_client_ip, parse_user_agent
-from jwt import decode as jwt_decode
-from django.conf import settings
+from django.db import transaction
+from functools import partial
+
+
+def _record_session(user_id, token_jti, refresh_jti, ip_address, user_agent, browser_name,
+                    browser_version, device_type, device_name, os_name, os_version):
+    """Create the UserSession row for a freshly issued token pair"""
+    UserSession.objects.create(
+        user_id=user_id,
+        token_jti=token_jti,
+        refresh_token_jti=refresh_jti,
+        ip_address=ip_address,
+        user_agent=user_agent,
+        browser_name=browser_name,
+        browser_version=browser_version,
+        device_type=device_type,
+        device_name=device_name,
+        os_name=os_name,
+        os_version=os_version,
+    )
 
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -18,8 +38,20 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         return token
     
     def validate(self, attrs):
-        """Validate credentials and create session"""
-        data = super().validate(attrs)
+        """Validate credentials, issue tokens and create session"""
+        # Authenticate through TokenObtainSerializer and mint the token pair here,
+        # so the JTIs can be read from the payloads we just signed instead of
+        # decoding (and re-verifying) the encoded tokens again
+        data = super(TokenObtainPairSerializer, self).validate(attrs)
+        
+        refresh = self.get_token(self.user)
+        access = refresh.access_token
+        
+        data['refresh'] = str(refresh)
+        data['access'] = str(access)
+        
+        if api_settings.UPDATE_LAST_LOGIN:
+            update_last_login(None, self.user)
         
         # Get request from context
         request = self.context.get('request')
@@ -27,36 +59,24 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
             return data
         
         user = self.user
-        refresh = data.get('refresh')
-        access = data.get('access')
-        
-        # Extract JTI from tokens
-        try:
-            access_decoded = jwt_decode(access, settings.SECRET_KEY, algorithms=["HS256"])
-            token_jti = access_decoded.get('jti')
-            
-            refresh_jti = None
-            if refresh:
-                refresh_decoded = jwt_decode(refresh, settings.SECRET_KEY, algorithms=["HS256"])
-                refresh_jti = refresh_decoded.get('jti')
-        except Exception:
-            # If JTI extraction fails, generate a unique identifier
-            import uuid
-            token_jti = str(uuid.uuid4())
-            refresh_jti = str(uuid.uuid4()) if refresh else None
+        token_jti = access[api_settings.JTI_CLAIM]
+        refresh_jti = refresh[api_settings.JTI_CLAIM]
         
         # Get IP address
         ip_address = get_client_ip(request)
         
-        # Get and parse User-Agent
+        # Get and parse User-Agent (reusing the middleware's parse when available)
         user_agent = request.META.get('HTTP_USER_AGENT', '')
-        parsed_ua = parse_user_agent(user_agent)
+        parsed_ua = getattr(request, 'parsed_ua', None) or parse_user_agent(user_agent)
         
-        # Create session
-        UserSession.objects.create(
-            user=user,
+        # Record the session once the surrounding transaction (if any) commits;
+        # only primitives are passed (not the cached/lazy parsed_ua mapping) so
+        # the callable stays picklable and can be handed to a worker later
+        transaction.on_commit(partial(
+            _record_session,
+            user_id=user.pk,
             token_jti=token_jti,
-            refresh_token_jti=refresh_jti,
+            refresh_jti=refresh_jti,
             ip_address=ip_address,
             user_agent=user_agent,
             browser_name=parsed_ua['browser_name'],
@@ -65,16 +85,27 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
             device_name=parsed_ua.get('device_name'),
             os_name=parsed_ua['os_name'],
             os_version=parsed_ua.get('os_version'),
-        )
+        ))
         
         return data
 
 
-class UserSessionSerializer(serializers.ModelSerializer):
-    """Full session details serializer"""
-    
+class BaseUserSessionSerializer(serializers.ModelSerializer):
+    """Shared Meta for UserSession serializers - minimal read-only session data"""
+
     class Meta:
         model = UserSession
+        fields = [
+            'id', 'browser_name', 'device_type', 'device_name',
+            'os_name', 'ip_address', 'login_date', 'last_activity', 'is_active'
+        ]
+        read_only_fields = fields
+
+
+class UserSessionSerializer(BaseUserSessionSerializer):
+    """Full session details serializer"""
+    
+    class Meta(BaseUserSessionSerializer.Meta):
         fields = [
             'id', 'token_jti', 'refresh_token_jti', 'ip_address', 'user_agent',
             'browser_name', 'browser_version', 'device_type', 'device_name',
@@ -88,38 +119,35 @@ class UserSessionSerializer(serializers.ModelSerializer):
         ]
 
 
-class UserSessionListSerializer(serializers.ModelSerializer):
+class UserSessionListSerializer(BaseUserSessionSerializer):
     """Minimal session data for list views"""
 
+
+class SessionUserSerializer(serializers.ModelSerializer):
+    """Minimal owner info embedded in admin session listings"""
+
     class Meta:
-        model = UserSession
-        fields = [
-            'id', 'browser_name', 'device_type', 'device_name',
-            'os_name', 'ip_address', 'login_date', 'last_activity', 'is_active'
-        ]
+        model = User
+        fields = ['id', 'username', 'first_name', 'last_name']
         read_only_fields = fields
 
 
-class AdminUserSessionListSerializer(serializers.ModelSerializer):
+class AdminUserSessionListSerializer(BaseUserSessionSerializer):
     """Session data for admin list views - includes user info"""
 
-    user = serializers.SerializerMethodField()
+    user = SessionUserSerializer(read_only=True)
 
-    class Meta:
-        model = UserSession
+    class Meta(BaseUserSessionSerializer.Meta):
         fields = [
             'id', 'user', 'browser_name', 'device_type', 'device_name',
             'os_name', 'ip_address', 'login_date', 'last_activity', 'is_active'
         ]
         read_only_fields = fields
 
-    def get_user(self, obj):
-        return {
-            'id': obj.user.id,
-            'username': obj.user.username,
-            'first_name': obj.user.first_name,
-            'last_name': obj.user.last_name
-        }
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        """Join the session owner so the nested user doesn't query once per row"""
+        return queryset.select_related('user')
 
 
 class UserSessionCreateSerializer(serializers.Serializer):
@@ -3,10 +3,26 @@ Tests for UserSession model and related functionality
 """
 import pytest
 from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from django.utils import timezone
 from datetime import timedelta
+from io import StringIO
+from jwt import decode as jwt_decode
+from rest_framework_simplejwt.tokens import RefreshToken
 
+from accounts import utils
+from accounts.middleware import ParsedUserAgentMiddleware
 from accounts.models import UserSession
+from accounts.serializers import (
+    UserSessionSerializer,
+    UserSessionListSerializer,
+    UserSessionCreateSerializer,
+)
+from accounts.utils import can_delete_session, get_client_ip, parse_user_agent
+from accounts.views import CanDeleteSessionPermission
 
 
 @pytest.mark.django_db
@@ -41,59 +57,23 @@ class TestUserSessionModel:
         assert session.login_date is not None
         assert session.last_activity is not None
     
-    def test_user_session_str_representation(self, regular_user):
+    def test_user_session_str_representation(self, baseline_session):
         """Test UserSession string representation"""
-        session = UserSession.objects.create(
-            user=regular_user,
-            token_jti='test-jti',
-            ip_address='192.168.1.1',
-            user_agent='Test Agent',
-            browser_name='Chrome',
-            device_type='desktop',
-            os_name='Windows',
-        )
-        
-        str_repr = str(session)
-        assert regular_user.username in str_repr
+        str_repr = str(baseline_session)
+        assert baseline_session.user.username in str_repr
         assert 'Chrome' in str_repr or 'Windows' in str_repr
     
-    def test_user_session_ordering(self, regular_user):
+    def test_user_session_ordering(self, regular_user, make_sessions):
         """Test that sessions are ordered by login_date descending"""
-        # Create sessions with different login dates
-        session1 = UserSession.objects.create(
-            user=regular_user,
-            token_jti='jti-1',
-            ip_address='192.168.1.1',
-            user_agent='Test',
-            browser_name='Chrome',
-            device_type='desktop',
-            os_name='Windows',
-        )
-        session1.login_date = timezone.now() - timedelta(days=2)
-        session1.save()
-        
-        session2 = UserSession.objects.create(
-            user=regular_user,
-            token_jti='jti-2',
-            ip_address='192.168.1.2',
-            user_agent='Test',
-            browser_name='Firefox',
-            device_type='desktop',
-            os_name='Linux',
-        )
-        session2.login_date = timezone.now() - timedelta(days=1)
-        session2.save()
-        
-        session3 = UserSession.objects.create(
-            user=regular_user,
-            token_jti='jti-3',
-            ip_address='192.168.1.3',
-            user_agent='Test',
-            browser_name='Safari',
-            device_type='mobile',
-            os_name='iOS',
-        )
-        # session3 has the most recent login_date (auto_now_add)
+        # Create sessions with different login dates; jti-3 keeps its
+        # auto_now_add login_date and so is the most recent
+        make_sessions(regular_user, [
+            {'token_jti': 'jti-1', 'login_date': timezone.now() - timedelta(days=2)},
+            {'token_jti': 'jti-2', 'ip_address': '192.168.1.2', 'browser_name': 'Firefox',
+             'os_name': 'Linux', 'login_date': timezone.now() - timedelta(days=1)},
+            {'token_jti': 'jti-3', 'ip_address': '192.168.1.3', 'browser_name': 'Safari',
+             'device_type': 'mobile', 'os_name': 'iOS'},
+        ])
         
         sessions = list(UserSession.objects.filter(user=regular_user))
         
@@ -102,23 +82,9 @@ class TestUserSessionModel:
         assert sessions[1].login_date >= sessions[2].login_date
         assert sessions[0].token_jti == 'jti-3'  # Most recent
     
-    def test_user_session_optional_fields(self, regular_user):
+    def test_user_session_optional_fields(self, baseline_session):
         """Test that optional fields can be null"""
-        session = UserSession.objects.create(
-            user=regular_user,
-            token_jti='test-jti',
-            ip_address='192.168.1.1',
-            user_agent='Test',
-            browser_name='Chrome',
-            device_type='desktop',
-            os_name='Windows',
-            refresh_token_jti=None,
-            browser_version=None,
-            device_name=None,
-            os_version=None,
-            screen_width=None,
-            screen_height=None,
-        )
+        session = UserSession.objects.get(pk=baseline_session.pk)
         
         assert session.refresh_token_jti is None
         assert session.browser_version is None
@@ -127,19 +93,9 @@ class TestUserSessionModel:
         assert session.screen_width is None
         assert session.screen_height is None
     
-    def test_user_session_is_active_default(self, regular_user):
+    def test_user_session_is_active_default(self, baseline_session):
         """Test that is_active defaults to True"""
-        session = UserSession.objects.create(
-            user=regular_user,
-            token_jti='test-jti',
-            ip_address='192.168.1.1',
-            user_agent='Test',
-            browser_name='Chrome',
-            device_type='desktop',
-            os_name='Windows',
-        )
-        
-        assert session.is_active is True
+        assert baseline_session.is_active is True
     
     def test_user_session_cascade_delete(self, regular_user):
         """Test that sessions are deleted when user is deleted"""
@@ -158,245 +114,206 @@ class TestUserSessionModel:
         
         assert not UserSession.objects.filter(id=session_id).exists()
     
-    def test_user_session_multiple_sessions_per_user(self, regular_user):
+    def test_user_session_multiple_sessions_per_user(self, regular_user, make_sessions, latest_session_snapshot):
         """Test that a user can have multiple active sessions"""
-        session1 = UserSession.objects.create(
+        session1, session2 = make_sessions(regular_user, [
+            {'token_jti': 'jti-1'},
+            {'token_jti': 'jti-2', 'ip_address': '192.168.1.2', 'browser_name': 'Firefox',
+             'device_type': 'mobile', 'os_name': 'Android'},
+        ])
+        
+        session_count, newest = latest_session_snapshot(regular_user)
+        assert session_count == 2
+        assert newest.is_active is True
+        assert session1.user == session2.user == regular_user
+    
+    def test_user_session_touch_updates_only_last_activity(self, regular_user):
+        """Test that touch() bumps last_activity with a single-column UPDATE"""
+        
+        session = UserSession.objects.create(
             user=regular_user,
-            token_jti='jti-1',
+            token_jti='test-jti',
             ip_address='192.168.1.1',
             user_agent='Test',
             browser_name='Chrome',
             device_type='desktop',
             os_name='Windows',
         )
-        
-        session2 = UserSession.objects.create(
-            user=regular_user,
-            token_jti='jti-2',
-            ip_address='192.168.1.2',
-            user_agent='Test',
-            browser_name='Firefox',
-            device_type='mobile',
-            os_name='Android',
+        UserSession.objects.filter(pk=session.pk).update(
+            last_activity=timezone.now() - timedelta(hours=1)
         )
+        session.refresh_from_db()
+        previous_activity = session.last_activity
         
-        assert UserSession.objects.filter(user=regular_user).count() == 2
-        assert session1.user == session2.user == regular_user
+        with CaptureQueriesContext(connection) as ctx:
+            session.touch()
+        
+        assert len(ctx.captured_queries) == 1
+        assert '"user_agent"' not in ctx.captured_queries[0]['sql']
+        session.refresh_from_db()
+        assert session.last_activity > previous_activity
 
 
-@pytest.mark.django_db
-class TestSessionUtilities:
-    """Tests for session utility functions"""
-    
-    def test_get_client_ip_direct(self):
-        """Test extracting IP from request without proxy"""
-        from django.test import RequestFactory
-        from accounts.utils import get_client_ip
-        
-        factory = RequestFactory()
-        request = factory.get('/', REMOTE_ADDR='192.168.1.100')
-        
-        ip = get_client_ip(request)
-        assert ip == '192.168.1.100'
-    
-    def test_get_client_ip_with_x_forwarded_for(self):
-        """Test extracting IP from X-Forwarded-For header"""
-        from django.test import RequestFactory
-        from accounts.utils import get_client_ip
-        
-        factory = RequestFactory()
-        request = factory.get(
-            '/',
-            REMOTE_ADDR='10.0.0.1',
-            HTTP_X_FORWARDED_FOR='203.0.113.1, 198.51.100.1'
-        )
-        
-        ip = get_client_ip(request)
-        # Should get the first IP from X-Forwarded-For
-        assert ip == '203.0.113.1'
-    
-    def test_get_client_ip_with_x_real_ip(self):
-        """Test extracting IP from X-Real-IP header"""
-        from django.test import RequestFactory
-        from accounts.utils import get_client_ip
-        
-        factory = RequestFactory()
-        request = factory.get(
-            '/',
-            REMOTE_ADDR='10.0.0.1',
-            HTTP_X_REAL_IP='203.0.113.2'
-        )
-        
-        ip = get_client_ip(request)
-        assert ip == '203.0.113.2'
+class TestSessionUtilitiesPure:
+    """Tests for session utility functions that don't touch the database"""
     
-    def test_get_client_ip_priority(self):
-        """Test that X-Forwarded-For takes priority over X-Real-IP"""
-        from django.test import RequestFactory
-        from accounts.utils import get_client_ip
-        
-        factory = RequestFactory()
-        request = factory.get(
-            '/',
-            REMOTE_ADDR='10.0.0.1',
-            HTTP_X_FORWARDED_FOR='203.0.113.1',
-            HTTP_X_REAL_IP='203.0.113.2'
-        )
-        
-        ip = get_client_ip(request)
-        # X-Forwarded-For should take priority
-        assert ip == '203.0.113.1'
-    
-    def test_parse_user_agent_chrome(self):
-        """Test parsing Chrome user agent"""
-        from accounts.utils import parse_user_agent
-        
-        user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+    @pytest.mark.parametrize('remote_addr,headers,expected_ip', [
+        pytest.param('192.168.1.100', {}, '192.168.1.100', id='direct'),
+        # Should get the first IP from X-Forwarded-For
+        pytest.param(
+            '10.0.0.1',
+            {'HTTP_X_FORWARDED_FOR': '203.0.113.1, 198.51.100.1'},
+            '203.0.113.1',
+            id='x_forwarded_for',
+        ),
+        pytest.param(
+            '10.0.0.1',
+            {'HTTP_X_REAL_IP': '203.0.113.2'},
+            '203.0.113.2',
+            id='x_real_ip',
+        ),
+        # X-Forwarded-For should take priority over X-Real-IP
+        pytest.param(
+            '10.0.0.1',
+            {'HTTP_X_FORWARDED_FOR': '203.0.113.1', 'HTTP_X_REAL_IP': '203.0.113.2'},
+            '203.0.113.1',
+            id='priority',
+        ),
+    ])
+    def test_get_client_ip(self, rf, remote_addr, headers, expected_ip):
+        """Test extracting the client IP with and without proxy headers"""
+        request = rf.get('/', REMOTE_ADDR=remote_addr, **headers)
+        
+        assert get_client_ip(request) == expected_ip
+    
+    @pytest.mark.parametrize('user_agent,expected,version_fragment', [
+        pytest.param(
+            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            {'browser_name': 'Chrome', 'os_name': 'Windows', 'device_type': 'desktop'},
+            '120',
+            id='chrome',
+        ),
+        pytest.param(
+            'Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0',
+            {'browser_name': 'Firefox', 'os_name': 'Linux', 'device_type': 'desktop'},
+            '121',
+            id='firefox',
+        ),
+        pytest.param(
+            'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1',
+            {'browser_name': 'Mobile Safari', 'os_name': 'iOS', 'device_type': 'mobile'},
+            None,
+            id='mobile',
+        ),
+        pytest.param(
+            'Mozilla/5.0 (iPad; CPU OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1',
+            {'os_name': 'iOS', 'device_type': 'tablet'},
+            None,
+            id='tablet',
+        ),
+        # Unknown agents should still return a valid structure with defaults
+        pytest.param('Unknown Browser 1.0', {}, None, id='unknown'),
+    ])
+    def test_parse_user_agent(self, user_agent, expected, version_fragment):
+        """Test parsing common and unknown user agents"""
         result = parse_user_agent(user_agent)
         
-        assert result['browser_name'] == 'Chrome'
-        assert '120' in result.get('browser_version', '')
-        assert result['os_name'] == 'Windows'
-        assert result['device_type'] == 'desktop'
-    
-    def test_parse_user_agent_firefox(self):
-        """Test parsing Firefox user agent"""
-        from accounts.utils import parse_user_agent
-        
+        assert 'browser_name' in result
+        assert 'os_name' in result
+        assert result['device_type'] in ['desktop', 'mobile', 'tablet']
+        for field, value in expected.items():
+            assert result[field] == value
+        if version_fragment:
+            assert version_fragment in result.get('browser_version', '')
+
+    def test_parse_user_agent_cached_and_read_only(self):
+        """Test that repeated User-Agent strings hit the cache and results are immutable"""
+
         user_agent = 'Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0'
-        result = parse_user_agent(user_agent)
-        
-        assert result['browser_name'] == 'Firefox'
-        assert '121' in result.get('browser_version', '')
-        assert result['os_name'] == 'Linux'
-        assert result['device_type'] == 'desktop'
-    
-    def test_parse_user_agent_mobile(self):
-        """Test parsing mobile user agent"""
-        from accounts.utils import parse_user_agent
+        first = parse_user_agent(user_agent)
+        second = parse_user_agent(user_agent)
 
-        user_agent = 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1'
-        result = parse_user_agent(user_agent)
+        assert first is second
+        with pytest.raises(TypeError):
+            first['browser_name'] = 'Changed'
 
-        assert result['browser_name'] == 'Mobile Safari'
-        assert result['os_name'] == 'iOS'
-        assert result['device_type'] == 'mobile'
-    
-    def test_parse_user_agent_tablet(self):
-        """Test parsing tablet user agent"""
-        from accounts.utils import parse_user_agent
-        
-        user_agent = 'Mozilla/5.0 (iPad; CPU OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1'
-        result = parse_user_agent(user_agent)
+    def test_parse_user_agent_fallback_versions(self, monkeypatch):
+        """Test the fallback parser used when user-agents isn't installed"""
+
+        monkeypatch.setattr(utils, 'USER_AGENTS_AVAILABLE', False)
+        result = utils._parse_user_agent(
+            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+        )
+
+        assert result['browser_name'] == 'Chrome'
+        assert result['browser_version'] == '120.0.0.0'
+        assert result['os_name'] == 'Windows'
+        assert result['os_version'] == '10.0'
+
+    def test_parsed_user_agent_middleware(self, rf):
+        """Test that the middleware exposes the parsed User-Agent on the request"""
         
-        assert result['device_type'] == 'tablet'
-        assert result['os_name'] == 'iOS'
-    
-    def test_parse_user_agent_unknown(self):
-        """Test parsing unknown user agent"""
-        from accounts.utils import parse_user_agent
+        user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+        request = rf.get('/', HTTP_USER_AGENT=user_agent)
         
-        user_agent = 'Unknown Browser 1.0'
-        result = parse_user_agent(user_agent)
+        middleware = ParsedUserAgentMiddleware(lambda req: req.parsed_ua)
+        parsed_ua = middleware(request)
         
-        # Should still return valid structure with defaults
-        assert 'browser_name' in result
-        assert 'os_name' in result
-        assert 'device_type' in result
-        assert result['device_type'] in ['desktop', 'mobile', 'tablet']
+        assert parsed_ua['browser_name'] == 'Chrome'
+        assert dict(parsed_ua) == dict(parse_user_agent(user_agent))
+
+
+@pytest.mark.django_db
+class TestSessionUtilitiesDB:
+    """Tests for session utility functions that need saved sessions"""
     
-    def test_can_delete_session_older_can_delete_newer(self, regular_user):
+    def test_can_delete_session_older_can_delete_newer(self, regular_user, make_sessions):
         """Test that older sessions can delete newer sessions"""
-        from accounts.utils import can_delete_session
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        older_session = UserSession.objects.create(
-            user=regular_user,
-            token_jti='older-jti',
-            ip_address='192.168.1.1',
-            user_agent='Test',
-            browser_name='Chrome',
-            device_type='desktop',
-            os_name='Windows',
-        )
-        older_session.login_date = timezone.now() - timedelta(days=2)
-        older_session.save()
         
-        newer_session = UserSession.objects.create(
-            user=regular_user,
-            token_jti='newer-jti',
-            ip_address='192.168.1.2',
-            user_agent='Test',
-            browser_name='Firefox',
-            device_type='desktop',
-            os_name='Linux',
-        )
-        newer_session.login_date = timezone.now() - timedelta(days=1)
-        newer_session.save()
+        older_session, newer_session = make_sessions(regular_user, [
+            {'token_jti': 'older-jti', 'login_date': timezone.now() - timedelta(days=2)},
+            {'token_jti': 'newer-jti', 'ip_address': '192.168.1.2', 'browser_name': 'Firefox',
+             'os_name': 'Linux', 'login_date': timezone.now() - timedelta(days=1)},
+        ])
         
         # Older session should be able to delete newer session
         assert can_delete_session(regular_user, older_session, newer_session) is True
     
-    def test_can_delete_session_newer_cannot_delete_older(self, regular_user):
+    def test_can_delete_session_newer_cannot_delete_older(self, regular_user, make_sessions):
         """Test that newer sessions cannot delete older sessions"""
-        from accounts.utils import can_delete_session
-        from django.utils import timezone
-        from datetime import timedelta
         
-        older_session = UserSession.objects.create(
-            user=regular_user,
-            token_jti='older-jti',
-            ip_address='192.168.1.1',
-            user_agent='Test',
-            browser_name='Chrome',
-            device_type='desktop',
-            os_name='Windows',
-        )
-        older_session.login_date = timezone.now() - timedelta(days=2)
-        older_session.save()
-        
-        newer_session = UserSession.objects.create(
-            user=regular_user,
-            token_jti='newer-jti',
-            ip_address='192.168.1.2',
-            user_agent='Test',
-            browser_name='Firefox',
-            device_type='desktop',
-            os_name='Linux',
-        )
-        newer_session.login_date = timezone.now() - timedelta(days=1)
-        newer_session.save()
+        older_session, newer_session = make_sessions(regular_user, [
+            {'token_jti': 'older-jti', 'login_date': timezone.now() - timedelta(days=2)},
+            {'token_jti': 'newer-jti', 'ip_address': '192.168.1.2', 'browser_name': 'Firefox',
+             'os_name': 'Linux', 'login_date': timezone.now() - timedelta(days=1)},
+        ])
         
         # Newer session should NOT be able to delete older session
         assert can_delete_session(regular_user, newer_session, older_session) is False
     
-    def test_can_delete_session_same_user_required(self, regular_user, admin_user):
+    def test_can_delete_session_same_user_required(self, regular_user, admin_user, make_sessions):
         """Test that only the session owner can delete"""
-        from accounts.utils import can_delete_session
-        
-        user_session = UserSession.objects.create(
-            user=regular_user,
-            token_jti='user-jti',
-            ip_address='192.168.1.1',
-            user_agent='Test',
-            browser_name='Chrome',
-            device_type='desktop',
-            os_name='Windows',
-        )
         
-        admin_session = UserSession.objects.create(
-            user=admin_user,
-            token_jti='admin-jti',
-            ip_address='192.168.1.2',
-            user_agent='Test',
-            browser_name='Firefox',
-            device_type='desktop',
-            os_name='Linux',
-        )
+        user_session, = make_sessions(regular_user, [{'token_jti': 'user-jti'}])
+        admin_session, = make_sessions(admin_user, [
+            {'token_jti': 'admin-jti', 'ip_address': '192.168.1.2',
+             'browser_name': 'Firefox', 'os_name': 'Linux'},
+        ])
         
         # Regular user cannot delete admin's session
         assert can_delete_session(regular_user, user_session, admin_session) is False
+    
+    def test_can_delete_session_runs_no_queries(self, regular_user, make_sessions, django_assert_num_queries):
+        """Test that the check only reads columns already loaded on the sessions"""
+        make_sessions(regular_user, [
+            {'token_jti': 'older-jti', 'login_date': timezone.now() - timedelta(days=2)},
+            {'token_jti': 'newer-jti', 'login_date': timezone.now() - timedelta(days=1)},
+        ])
+        # Fresh instances, so the sessions' users aren't cached
+        older_session, newer_session = UserSession.objects.filter(user=regular_user).order_by('login_date')
+        
+        with django_assert_num_queries(0):
+            assert can_delete_session(regular_user, older_session, newer_session) is True
 
 
 @pytest.mark.django_db
@@ -405,8 +322,6 @@ class TestSessionSerializers:
     
     def test_user_session_serializer_full_data(self, regular_user):
         """Test UserSessionSerializer with full data"""
-        from accounts.serializers import UserSessionSerializer
-        from django.utils import timezone
         
         session = UserSession.objects.create(
             user=regular_user,
@@ -443,21 +358,10 @@ class TestSessionSerializers:
         assert 'last_activity' in data
         assert data['is_active'] is True
     
-    def test_user_session_list_serializer_minimal_data(self, regular_user):
+    def test_user_session_list_serializer_minimal_data(self, baseline_session):
         """Test UserSessionListSerializer with minimal fields"""
-        from accounts.serializers import UserSessionListSerializer
         
-        session = UserSession.objects.create(
-            user=regular_user,
-            token_jti='test-jti',
-            ip_address='192.168.1.1',
-            user_agent='Mozilla/5.0 Test',
-            browser_name='Chrome',
-            device_type='desktop',
-            os_name='Windows',
-        )
-        
-        serializer = UserSessionListSerializer(session)
+        serializer = UserSessionListSerializer(baseline_session)
         data = serializer.data
         
         # List serializer should have minimal fields
@@ -473,7 +377,6 @@ class TestSessionSerializers:
     
     def test_user_session_create_serializer_validation(self):
         """Test UserSessionCreateSerializer validation"""
-        from accounts.serializers import UserSessionCreateSerializer
         
         # Valid data
         valid_data = {
@@ -498,25 +401,23 @@ class TestSessionSerializers:
 class TestSessionCreationOnLogin:
     """Tests for session creation during login"""
     
-    def test_session_creation_on_login(self, api_client, regular_user):
+    def test_session_creation_on_login(self, api_client, regular_user, django_capture_on_commit_callbacks, latest_session_snapshot):
         """Test that a session is created when user logs in"""
-        from accounts.models import UserSession
-        from django.urls import reverse
         
-        initial_count = UserSession.objects.filter(user=regular_user).count()
+        initial_count, _ = latest_session_snapshot(regular_user)
         
         data = {'username': 'regular_user', 'password': 'password123'}
-        response = api_client.post(reverse('token_obtain_pair'), data)
+        with django_capture_on_commit_callbacks(execute=True):
+            response = api_client.post(reverse('token_obtain_pair'), data)
         
         assert response.status_code == 200
         assert 'access' in response.data
         
         # Check that a session was created
-        sessions = UserSession.objects.filter(user=regular_user)
-        assert sessions.count() == initial_count + 1
+        session_count, session = latest_session_snapshot(regular_user)
+        assert session_count == initial_count + 1
         
         # Check session data
-        session = sessions.latest('login_date')
         assert session.token_jti is not None
         assert session.ip_address is not None
         assert session.browser_name is not None
@@ -524,65 +425,90 @@ class TestSessionCreationOnLogin:
         assert session.os_name is not None
         assert session.is_active is True
     
-    def test_session_creation_with_jti_in_token(self, api_client, regular_user):
+    def test_session_creation_callback_is_picklable(self, api_client, regular_user, django_capture_on_commit_callbacks):
+        """Test that the deferred session write captures only picklable primitives"""
+        import pickle
+        
+        data = {'username': 'regular_user', 'password': 'password123'}
+        with django_capture_on_commit_callbacks() as callbacks:
+            response = api_client.post(reverse('token_obtain_pair'), data, HTTP_USER_AGENT='Mozilla/5.0 Test')
+        
+        assert response.status_code == 200
+        assert len(callbacks) == 1
+        restored = pickle.loads(pickle.dumps(callbacks[0]))
+        assert restored.keywords['user_id'] == regular_user.id
+        assert isinstance(restored.keywords['browser_name'], str)
+    
+    def test_session_creation_with_jti_in_token(self, api_client, regular_user, django_capture_on_commit_callbacks, latest_session_snapshot):
         """Test that token JTI is stored in session"""
-        from accounts.models import UserSession
-        from rest_framework_simplejwt.tokens import UntypedToken
-        from jwt import decode as jwt_decode
-        from django.conf import settings
-        from django.urls import reverse
         
         data = {'username': 'regular_user', 'password': 'password123'}
-        response = api_client.post(reverse('token_obtain_pair'), data)
+        with django_capture_on_commit_callbacks(execute=True):
+            response = api_client.post(reverse('token_obtain_pair'), data)
         
         assert response.status_code == 200
         access_token = response.data['access']
         
-        # Decode token to get JTI
-        decoded = jwt_decode(access_token, settings.SECRET_KEY, algorithms=["HS256"])
+        # Read the JTI claim; the signature was already checked when it was issued
+        decoded = jwt_decode(access_token, options={"verify_signature": False})
         token_jti = decoded.get('jti')
         
         # Check that session has matching JTI
-        session = UserSession.objects.filter(user=regular_user).latest('login_date')
+        session_count, session = latest_session_snapshot(regular_user)
+        assert session_count == 1
         assert session.token_jti == token_jti
-    
-    def test_session_creation_with_ip_address(self, api_client, regular_user):
+
+    def test_session_creation_with_refresh_jti_in_token(self, api_client, regular_user, django_capture_on_commit_callbacks, latest_session_snapshot):
+        """Test that the refresh token JTI from the issued pair is stored in session"""
+
+        data = {'username': 'regular_user', 'password': 'password123'}
+        with django_capture_on_commit_callbacks(execute=True):
+            response = api_client.post(reverse('token_obtain_pair'), data)
+
+        assert response.status_code == 200
+        decoded = jwt_decode(response.data['refresh'], options={"verify_signature": False})
+
+        session_count, session = latest_session_snapshot(regular_user)
+        assert session_count == 1
+        assert session.refresh_token_jti == decoded.get('jti')
+        assert session.refresh_token_jti != session.token_jti
+
+    def test_session_creation_with_ip_address(self, api_client, regular_user, django_capture_on_commit_callbacks, latest_session_snapshot):
         """Test that IP address is captured from request"""
-        from accounts.models import UserSession
-        from django.urls import reverse
-        from django.test import RequestFactory
         
         # Make request with specific IP
         data = {'username': 'regular_user', 'password': 'password123'}
-        response = api_client.post(
-            reverse('token_obtain_pair'),
-            data,
-            REMOTE_ADDR='192.168.1.100'
-        )
+        with django_capture_on_commit_callbacks(execute=True):
+            response = api_client.post(
+                reverse('token_obtain_pair'),
+                data,
+                REMOTE_ADDR='192.168.1.100'
+            )
         
         assert response.status_code == 200
         
-        session = UserSession.objects.filter(user=regular_user).latest('login_date')
+        session_count, session = latest_session_snapshot(regular_user)
+        assert session_count == 1
         # IP should be captured (might be 127.0.0.1 in test environment)
         assert session.ip_address is not None
     
-    def test_session_creation_with_user_agent(self, api_client, regular_user):
+    def test_session_creation_with_user_agent(self, api_client, regular_user, django_capture_on_commit_callbacks, latest_session_snapshot):
         """Test that User-Agent is captured and parsed"""
-        from accounts.models import UserSession
-        from django.urls import reverse
         
         user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0.0.0'
         
         data = {'username': 'regular_user', 'password': 'password123'}
-        response = api_client.post(
-            reverse('token_obtain_pair'),
-            data,
-            HTTP_USER_AGENT=user_agent
-        )
+        with django_capture_on_commit_callbacks(execute=True):
+            response = api_client.post(
+                reverse('token_obtain_pair'),
+                data,
+                HTTP_USER_AGENT=user_agent
+            )
         
         assert response.status_code == 200
         
-        session = UserSession.objects.filter(user=regular_user).latest('login_date')
+        session_count, session = latest_session_snapshot(regular_user)
+        assert session_count == 1
         assert session.user_agent == user_agent
         assert session.browser_name is not None
         assert session.os_name is not None
@@ -592,48 +518,69 @@ class TestSessionCreationOnLogin:
 class TestSessionViews:
     """Tests for session API views"""
     
-    def test_list_sessions_authenticated_user(self, authenticated_regular_client, regular_user):
+    def test_list_sessions_authenticated_user(self, authenticated_regular_client, regular_user, make_sessions):
         """Test that authenticated user can list their own sessions"""
-        from django.urls import reverse
         
         # Create some sessions
+        make_sessions(regular_user, [
+            {'token_jti': 'jti-1'},
+            {'token_jti': 'jti-2', 'ip_address': '192.168.1.2', 'browser_name': 'Firefox',
+             'device_type': 'mobile', 'os_name': 'Android'},
+        ])
+        
+        response = authenticated_regular_client.get(reverse('usersession-list'))
+        
+        assert response.status_code == 200
+        # Handle paginated response
+        sessions = response.data.get('results', response.data)
+        assert len(sessions) >= 2
+        assert all(s['browser_name'] for s in sessions)
+    
+    def test_list_sessions_skips_unrendered_columns(self, authenticated_regular_client, regular_user):
+        """Test that the session list query doesn't load the raw User-Agent text"""
+        
         UserSession.objects.create(
             user=regular_user,
             token_jti='jti-1',
             ip_address='192.168.1.1',
-            user_agent='Test',
+            user_agent='Mozilla/5.0 ' + 'x' * 1000,
             browser_name='Chrome',
             device_type='desktop',
             os_name='Windows',
         )
-        UserSession.objects.create(
-            user=regular_user,
-            token_jti='jti-2',
-            ip_address='192.168.1.2',
-            user_agent='Test',
-            browser_name='Firefox',
-            device_type='mobile',
-            os_name='Android',
-        )
         
-        response = authenticated_regular_client.get(reverse('usersession-list'))
+        with CaptureQueriesContext(connection) as ctx:
+            response = authenticated_regular_client.get(reverse('usersession-list'))
         
         assert response.status_code == 200
-        # Handle paginated response
-        sessions = response.data.get('results', response.data)
-        assert len(sessions) >= 2
-        assert all(s['browser_name'] for s in sessions)
+        session_queries = [q['sql'] for q in ctx.captured_queries if 'FROM "accounts_usersession"' in q['sql']]
+        assert session_queries
+        assert not any('"user_agent"' in sql for sql in session_queries)
     
+    def test_list_sessions_query_count_constant(self, authenticated_regular_client, regular_user, make_sessions):
+        """Test that listing own sessions costs the same number of queries regardless of session count"""
+
+        make_sessions(regular_user, [{'token_jti': 'jti-1'}])
+        with CaptureQueriesContext(connection) as single:
+            response = authenticated_regular_client.get(reverse('usersession-list'))
+        assert response.status_code == 200
+
+        make_sessions(regular_user, [{'token_jti': 'jti-2'}, {'token_jti': 'jti-3'}])
+        with CaptureQueriesContext(connection) as multiple:
+            response = authenticated_regular_client.get(reverse('usersession-list'))
+        assert response.status_code == 200
+        assert len(response.data.get('results', response.data)) == 3
+
+        assert len(multiple.captured_queries) == len(single.captured_queries)
+
     def test_list_sessions_unauthenticated(self, api_client):
         """Test that unauthenticated users cannot list sessions"""
-        from django.urls import reverse
         
         response = api_client.get(reverse('usersession-list'))
         assert response.status_code == 401
     
     def test_retrieve_own_session(self, authenticated_regular_client, regular_user):
         """Test that user can retrieve their own session"""
-        from django.urls import reverse
         
         session = UserSession.objects.create(
             user=regular_user,
@@ -652,9 +599,21 @@ class TestSessionViews:
         assert response.data['browser_name'] == 'Chrome'
         assert response.data['ip_address'] == '192.168.1.1'
     
+    def test_retrieve_own_session_does_not_reload_user(self, authenticated_regular_client, regular_user, make_sessions):
+        """Test that the ownership check doesn't query the session's user again"""
+        
+        session, = make_sessions(regular_user, [{'token_jti': 'jti-1'}])
+        
+        with CaptureQueriesContext(connection) as ctx:
+            response = authenticated_regular_client.get(reverse('usersession-detail', args=[session.id]))
+        
+        assert response.status_code == 200
+        # Only the JWT authentication looks up the user
+        user_queries = [q['sql'] for q in ctx.captured_queries if 'FROM "auth_user"' in q['sql']]
+        assert len(user_queries) == 1
+    
     def test_retrieve_other_user_session_forbidden(self, authenticated_regular_client, regular_user, admin_user):
         """Test that user cannot retrieve another user's session"""
-        from django.urls import reverse
         
         session = UserSession.objects.create(
             user=admin_user,
@@ -672,7 +631,6 @@ class TestSessionViews:
     
     def test_retrieve_session_as_admin(self, authenticated_admin_client, regular_user, admin_user):
         """Test that admin can retrieve any user's session"""
-        from django.urls import reverse
         
         session = UserSession.objects.create(
             user=regular_user,
@@ -689,46 +647,40 @@ class TestSessionViews:
         assert response.status_code == 200
         assert response.data['id'] == session.id
     
-    def test_delete_own_older_session(self, api_client, regular_user):
+    def test_update_device_info(self, authenticated_regular_client, regular_user, make_sessions):
+        """Test that device info updates only the provided screen fields and bumps last_activity"""
+        
+        session, = make_sessions(regular_user, [{'token_jti': 'jti-1', 'screen_width': 1280, 'screen_height': 720}])
+        before = UserSession.objects.get(pk=session.pk).last_activity
+        
+        response = authenticated_regular_client.post(
+            reverse('usersession-update-device-info', args=[session.id]),
+            {'screen_width': 1920},
+            format='json'
+        )
+        
+        assert response.status_code == 200
+        assert response.data['screen_width'] == 1920
+        assert response.data['screen_height'] == 720
+        session.refresh_from_db()
+        assert (session.screen_width, session.screen_height) == (1920, 720)
+        assert session.last_activity > before
+    
+    def test_delete_own_older_session(self, api_client, regular_user, make_sessions):
         """Test that user can delete their own newer session with older session"""
-        from django.urls import reverse
-        from django.utils import timezone
-        from datetime import timedelta
-        from rest_framework_simplejwt.tokens import RefreshToken
-        from jwt import decode as jwt_decode
-        from django.conf import settings
 
         # Create the token first to get its JTI
         refresh = RefreshToken.for_user(regular_user)
         access_token = refresh.access_token
-        decoded = jwt_decode(str(access_token), settings.SECRET_KEY, algorithms=["HS256"])
-        token_jti = decoded.get('jti')
-
-        # Create older session (the one making the request) with the token's JTI
-        older_session = UserSession.objects.create(
-            user=regular_user,
-            token_jti=token_jti,
-            ip_address='192.168.1.1',
-            user_agent='Test',
-            browser_name='Chrome',
-            device_type='desktop',
-            os_name='Windows',
-        )
-        older_session.login_date = timezone.now() - timedelta(days=2)
-        older_session.save()
+        token_jti = access_token['jti']
 
-        # Create newer session (to be deleted)
-        newer_session = UserSession.objects.create(
-            user=regular_user,
-            token_jti='newer-jti',
-            ip_address='192.168.1.2',
-            user_agent='Test',
-            browser_name='Firefox',
-            device_type='desktop',
-            os_name='Linux',
-        )
-        newer_session.login_date = timezone.now() - timedelta(days=1)
-        newer_session.save()
+        # Older session (the one making the request) carries the token's JTI;
+        # the newer one is to be deleted
+        older_session, newer_session = make_sessions(regular_user, [
+            {'token_jti': token_jti, 'login_date': timezone.now() - timedelta(days=2)},
+            {'token_jti': 'newer-jti', 'ip_address': '192.168.1.2', 'browser_name': 'Firefox',
+             'os_name': 'Linux', 'login_date': timezone.now() - timedelta(days=1)},
+        ])
 
         # Use the client with the token
         api_client.credentials(HTTP_AUTHORIZATION=f'Bearer {access_token}')
@@ -741,37 +693,15 @@ class TestSessionViews:
         assert response.status_code in [200, 204]
         assert not UserSession.objects.filter(id=newer_session.id).exists()
     
-    def test_delete_own_newer_session_forbidden(self, authenticated_regular_client, regular_user):
+    def test_delete_own_newer_session_forbidden(self, authenticated_regular_client, regular_user, make_sessions):
         """Test that user cannot delete older session with newer session"""
-        from django.urls import reverse
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        # Create older session
-        older_session = UserSession.objects.create(
-            user=regular_user,
-            token_jti='older-jti',
-            ip_address='192.168.1.1',
-            user_agent='Test',
-            browser_name='Chrome',
-            device_type='desktop',
-            os_name='Windows',
-        )
-        older_session.login_date = timezone.now() - timedelta(days=2)
-        older_session.save()
         
-        # Create newer session (the one making the request)
-        newer_session = UserSession.objects.create(
-            user=regular_user,
-            token_jti='newer-jti',
-            ip_address='192.168.1.2',
-            user_agent='Test',
-            browser_name='Firefox',
-            device_type='desktop',
-            os_name='Linux',
-        )
-        newer_session.login_date = timezone.now() - timedelta(days=1)
-        newer_session.save()
+        # The newer session is the one making the request
+        older_session, newer_session = make_sessions(regular_user, [
+            {'token_jti': 'older-jti', 'login_date': timezone.now() - timedelta(days=2)},
+            {'token_jti': 'newer-jti', 'ip_address': '192.168.1.2', 'browser_name': 'Firefox',
+             'os_name': 'Linux', 'login_date': timezone.now() - timedelta(days=1)},
+        ])
         
         response = authenticated_regular_client.delete(
             reverse('usersession-detail', args=[older_session.id])
@@ -781,9 +711,38 @@ class TestSessionViews:
         assert response.status_code == 403
         assert UserSession.objects.filter(id=older_session.id).exists()
     
+    def test_delete_older_session_from_newer_token_explains_rule(self, api_client, regular_user, make_sessions):
+        """Test that the permission's denial message is returned when a newer session deletes an older one"""
+        
+        access_token = RefreshToken.for_user(regular_user).access_token
+        older_session, newer_session = make_sessions(regular_user, [
+            {'token_jti': 'older-jti', 'login_date': timezone.now() - timedelta(days=2)},
+            {'token_jti': access_token['jti'], 'login_date': timezone.now() - timedelta(days=1)},
+        ])
+        api_client.credentials(HTTP_AUTHORIZATION=f'Bearer {access_token}')
+        
+        response = api_client.delete(reverse('usersession-detail', args=[older_session.id]))
+        
+        assert response.status_code == 403
+        assert response.data['detail'] == CanDeleteSessionPermission.message
+        assert UserSession.objects.filter(id=older_session.id).exists()
+    
+    def test_delete_current_session_forbidden_without_lookup(self, api_client, regular_user, make_sessions):
+        """Test that a session can't delete itself and isn't looked up by JTI to decide that"""
+        
+        access_token = RefreshToken.for_user(regular_user).access_token
+        current_session, = make_sessions(regular_user, [{'token_jti': access_token['jti']}])
+        api_client.credentials(HTTP_AUTHORIZATION=f'Bearer {access_token}')
+        
+        with CaptureQueriesContext(connection) as ctx:
+            response = api_client.delete(reverse('usersession-detail', args=[current_session.id]))
+        
+        assert response.status_code == 403
+        assert UserSession.objects.filter(id=current_session.id).exists()
+        assert not any('"token_jti" = ' in q['sql'] for q in ctx.captured_queries)
+    
     def test_delete_own_session_as_admin_allowed(self, authenticated_admin_client, regular_user):
         """Test that admin can delete any session"""
-        from django.urls import reverse
         
         session = UserSession.objects.create(
             user=regular_user,
@@ -807,29 +766,15 @@ class TestSessionViews:
 class TestAdminSessionViews:
     """Tests for admin session management endpoints"""
     
-    def test_admin_list_user_sessions(self, authenticated_admin_client, regular_user):
+    def test_admin_list_user_sessions(self, authenticated_admin_client, regular_user, make_sessions):
         """Test that admin can list sessions for a specific user"""
-        from django.urls import reverse
         
         # Create sessions for regular user
-        UserSession.objects.create(
-            user=regular_user,
-            token_jti='jti-1',
-            ip_address='192.168.1.1',
-            user_agent='Test',
-            browser_name='Chrome',
-            device_type='desktop',
-            os_name='Windows',
-        )
-        UserSession.objects.create(
-            user=regular_user,
-            token_jti='jti-2',
-            ip_address='192.168.1.2',
-            user_agent='Test',
-            browser_name='Firefox',
-            device_type='mobile',
-            os_name='Android',
-        )
+        make_sessions(regular_user, [
+            {'token_jti': 'jti-1'},
+            {'token_jti': 'jti-2', 'ip_address': '192.168.1.2', 'browser_name': 'Firefox',
+             'device_type': 'mobile', 'os_name': 'Android'},
+        ])
         
         response = authenticated_admin_client.get(
             reverse('admin-usersession-list'),
@@ -843,7 +788,6 @@ class TestAdminSessionViews:
     
     def test_admin_delete_any_session(self, authenticated_admin_client, regular_user):
         """Test that admin can delete any user's session"""
-        from django.urls import reverse
         
         session = UserSession.objects.create(
             user=regular_user,
@@ -864,8 +808,99 @@ class TestAdminSessionViews:
     
     def test_regular_user_cannot_access_admin_endpoints(self, authenticated_regular_client):
         """Test that regular users cannot access admin session endpoints"""
-        from django.urls import reverse
         
         response = authenticated_regular_client.get(reverse('admin-usersession-list'))
         assert response.status_code == 403
+    
+    def test_admin_list_sessions_query_count_constant(self, authenticated_admin_client, admin_user):
+        """Test that listing sessions doesn't query the user table once per session"""
+        
+        def create_session(username):
+            user = User.objects.create_user(username=username, password='password123')
+            UserSession.objects.create(
+                user=user,
+                token_jti=f'{username}-jti',
+                ip_address='192.168.1.1',
+                user_agent='Test',
+                browser_name='Chrome',
+                device_type='desktop',
+                os_name='Windows',
+            )
+        
+        create_session('first_user')
+        with CaptureQueriesContext(connection) as single:
+            response = authenticated_admin_client.get(reverse('admin-usersession-list'))
+        assert response.status_code == 200
+        
+        create_session('second_user')
+        create_session('third_user')
+        with CaptureQueriesContext(connection) as multiple:
+            response = authenticated_admin_client.get(reverse('admin-usersession-list'))
+        assert response.status_code == 200
+        assert len(response.data.get('results', response.data)) == 3
+        
+        assert len(multiple.captured_queries) == len(single.captured_queries)
 
+
+@pytest.mark.django_db
+class TestPruneSessionsCommand:
+    """Tests for the prune_sessions management command"""
+    
+    def test_prune_sessions_deletes_orphaned_sessions(self, regular_user):
+        """Test that sessions pointing at a missing user are removed"""
+        
+        kept, orphaned = UserSession.objects.bulk_create([
+            UserSession(
+                user=regular_user,
+                token_jti='kept-jti',
+                ip_address='192.168.1.1',
+                user_agent='Test',
+                browser_name='Chrome',
+                device_type='desktop',
+                os_name='Windows',
+            ),
+            UserSession(
+                user_id=regular_user.id + 1000,
+                token_jti='orphaned-jti',
+                ip_address='192.168.1.2',
+                user_agent='Test',
+                browser_name='Firefox',
+                device_type='desktop',
+                os_name='Linux',
+            ),
+        ])
+        
+        call_command('prune_sessions', stdout=StringIO())
+        
+        assert UserSession.objects.filter(id=kept.id).exists()
+        assert not UserSession.objects.filter(id=orphaned.id).exists()
+    
+    def test_prune_sessions_deletes_stale_inactive_sessions(self, regular_user):
+        """Test that only inactive sessions past the retention period are removed"""
+        
+        def create_session(jti, is_active, days_idle):
+            session = UserSession.objects.create(
+                user=regular_user,
+                token_jti=jti,
+                ip_address='192.168.1.1',
+                user_agent='Test',
+                browser_name='Chrome',
+                device_type='desktop',
+                os_name='Windows',
+                is_active=is_active,
+            )
+            # last_activity is auto_now, so backdate it with a queryset update
+            UserSession.objects.filter(pk=session.pk).update(
+                last_activity=timezone.now() - timedelta(days=days_idle)
+            )
+            return session
+        
+        stale = create_session('stale-jti', is_active=False, days_idle=45)
+        recent_inactive = create_session('recent-jti', is_active=False, days_idle=5)
+        old_active = create_session('active-jti', is_active=True, days_idle=45)
+        
+        call_command('prune_sessions', stdout=StringIO())
+        
+        assert not UserSession.objects.filter(id=stale.id).exists()
+        assert UserSession.objects.filter(id=recent_inactive.id).exists()
+        assert UserSession.objects.filter(id=old_active.id).exists()
@@ -58,7 +58,7 @@ class TestUserProfileModel:
         assert 'profile_pictures' in profile.profile_picture.name
         assert profile.profile_picture.name.endswith('.jpg')
     
-    def test_user_profile_delete_picture_on_delete(self):
+    def test_user_profile_delete_picture_on_delete(self, django_capture_on_commit_callbacks):
         """Test that profile picture file is deleted when profile is deleted"""
         import os
         from django.conf import settings
@@ -84,12 +84,41 @@ class TestUserProfileModel:
         picture_path = profile.profile_picture.path
         assert os.path.exists(picture_path)
         
-        # Delete profile (should delete picture file)
-        profile.delete()
+        # Delete profile (should delete picture file once committed)
+        with django_capture_on_commit_callbacks(execute=True):
+            profile.delete()
         
         # File should be deleted
         assert not os.path.exists(picture_path)
     
+    def test_user_profile_delete_keeps_picture_until_commit(self):
+        """Test that the picture file survives until the profile deletion commits"""
+        import os
+        from django.db import transaction
+        
+        user = User.objects.create_user(username='testuser', password='password')
+        profile = user.profile
+        
+        img_io = io.BytesIO()
+        Image.new('RGB', (100, 100), color='red').save(img_io, format='JPEG')
+        profile.profile_picture = SimpleUploadedFile(
+            "test_image.jpg",
+            img_io.getvalue(),
+            content_type="image/jpeg"
+        )
+        profile.save()
+        picture_path = profile.profile_picture.path
+        
+        try:
+            with transaction.atomic():
+                profile.delete()
+                raise RuntimeError('rollback')
+        except RuntimeError:
+            pass
+        
+        assert os.path.exists(picture_path)
+        profile.profile_picture.storage.delete(profile.profile_picture.name)
+    
     def test_user_profile_save_signal(self):
         """Test that UserProfile is saved when User is saved"""
         user = User.objects.create_user(username='testuser', password='password')
@@ -102,4 +131,16 @@ class TestUserProfileModel:
         # Profile should still exist
         profile.refresh_from_db()
         assert profile.user == user
-
+    
+    def test_user_save_does_not_rewrite_profile(self):
+        """Test that saving a User does not issue a write for its UserProfile"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        user = User.objects.create_user(username='testuser', password='password')
+        
+        user.first_name = 'Updated'
+        with CaptureQueriesContext(connection) as ctx:
+            user.save()
+        
+        assert not any('accounts_userprofile' in q['sql'] for q in ctx.captured_queries)
@@ -18,6 +18,31 @@ from accounts.utils import (
 )
 
 
+def encode_test_image(format='JPEG', size=(50, 50)):
+    """Helper to encode a solid-colour test image to bytes"""
+    output = BytesIO()
+    Image.new('RGB', size, color='red').save(output, format=format)
+    return output.getvalue()
+
+
+@pytest.fixture(scope='module')
+def jpeg_bytes():
+    """Small JPEG payload, encoded once per module"""
+    return encode_test_image('JPEG')
+
+
+@pytest.fixture(scope='module')
+def png_bytes():
+    """Small PNG payload, encoded once per module"""
+    return encode_test_image('PNG')
+
+
+@pytest.fixture(scope='module')
+def large_jpeg_bytes():
+    """JPEG payload larger than MAX_WIDTH x MAX_HEIGHT, encoded once per module"""
+    return encode_test_image('JPEG', (500, 500))
+
+
 class TestSanitizeFilename:
     """Tests for filename sanitization"""
     
@@ -59,32 +84,31 @@ class TestSanitizeFilename:
 class TestValidateImageFile:
     """Tests for image file validation"""
     
-    def create_test_image(self, format='JPEG', size=(50, 50)):
-        """Helper to create a test image"""
-        img = Image.new('RGB', size, color='red')
-        output = BytesIO()
-        img.save(output, format=format)
-        output.seek(0)
-        return output
-    
-    def test_validate_valid_jpeg(self):
+    def test_validate_valid_jpeg(self, jpeg_bytes):
         """Test validation of valid JPEG file"""
-        img_data = self.create_test_image('JPEG')
-        file = SimpleUploadedFile("test.jpg", img_data.read(), content_type="image/jpeg")
+        file = SimpleUploadedFile("test.jpg", jpeg_bytes, content_type="image/jpeg")
         image, error = validate_image_file(file)
         assert image is not None
         assert error is None
         assert image.format == 'JPEG'
     
-    def test_validate_valid_png(self):
+    def test_validate_valid_png(self, png_bytes):
         """Test validation of valid PNG file"""
-        img_data = self.create_test_image('PNG')
-        file = SimpleUploadedFile("test.png", img_data.read(), content_type="image/png")
+        file = SimpleUploadedFile("test.png", png_bytes, content_type="image/png")
         image, error = validate_image_file(file)
         assert image is not None
         assert error is None
         assert image.format == 'PNG'
     
+    def test_validate_large_jpeg_decoded_at_reduced_scale(self):
+        """Test that large JPEGs are decoded at a reduced scale, still above the target size"""
+        data = encode_test_image('JPEG', (1600, 800))
+        file = SimpleUploadedFile("test.jpg", data, content_type="image/jpeg")
+        image, error = validate_image_file(file)
+        assert error is None
+        assert image.size == (400, 200)
+        assert image.width >= MAX_WIDTH * 2 and image.height >= MAX_HEIGHT * 2
+    
     def test_validate_file_too_large(self):
         """Test validation fails for files exceeding size limit"""
         # Create a file larger than MAX_FILE_SIZE
@@ -95,24 +119,29 @@ class TestValidateImageFile:
         assert error is not None
         assert "exceeds maximum" in error.lower()
     
-    def test_validate_invalid_mime_type(self):
+    def test_validate_invalid_mime_type(self, jpeg_bytes):
         """Test validation fails for invalid MIME types"""
-        img_data = self.create_test_image('JPEG')
-        file = SimpleUploadedFile("test.gif", img_data.read(), content_type="image/gif")
+        file = SimpleUploadedFile("test.gif", jpeg_bytes, content_type="image/gif")
         image, error = validate_image_file(file)
         assert image is None
         assert error is not None
         assert "invalid file type" in error.lower()
     
-    def test_validate_invalid_extension(self):
+    def test_validate_invalid_extension(self, jpeg_bytes):
         """Test validation fails for invalid file extensions"""
-        img_data = self.create_test_image('JPEG')
-        file = SimpleUploadedFile("test.bmp", img_data.read(), content_type="image/jpeg")
+        file = SimpleUploadedFile("test.bmp", jpeg_bytes, content_type="image/jpeg")
         image, error = validate_image_file(file)
         assert image is None
         assert error is not None
         assert "invalid file extension" in error.lower()
     
+    def test_validate_disguised_file_type(self):
+        """Test validation fails for non-JPEG/PNG content sent as a JPEG"""
+        file = SimpleUploadedFile("test.jpg", encode_test_image('GIF'), content_type="image/jpeg")
+        image, error = validate_image_file(file)
+        assert image is None
+        assert "invalid file type" in error.lower()
+    
     def test_validate_corrupted_file(self):
         """Test validation fails for corrupted image files"""
         corrupted_data = b'This is not an image file'
@@ -120,6 +149,15 @@ class TestValidateImageFile:
         image, error = validate_image_file(file)
         assert image is None
         assert error is not None
+    
+    def test_validate_truncated_jpeg(self):
+        """Test validation fails for a JPEG whose pixel data is cut off"""
+        data = encode_test_image('JPEG', (80, 80))
+        # Headers stay intact, so the file still opens; only decoding fails
+        file = SimpleUploadedFile("test.jpg", data[:-100], content_type="image/jpeg")
+        image, error = validate_image_file(file)
+        assert image is None
+        assert error is not None
 
 
 class TestSanitizeImage:
@@ -167,6 +205,11 @@ class TestSanitizeImage:
         result = sanitize_image(img)
         assert result.size == (50, 50)
     
+    def test_sanitize_small_rgb_image_returned_as_is(self):
+        """Test that small RGB images skip conversion and resizing entirely"""
+        img = self.create_test_image('RGB', (MAX_WIDTH, MAX_HEIGHT))
+        assert sanitize_image(img) is img
+    
     def test_sanitize_maintains_aspect_ratio(self):
         """Test that aspect ratio is maintained during resize"""
         img = self.create_test_image('RGB', (200, 100))  # 2:1 ratio
@@ -177,24 +220,10 @@ class TestSanitizeImage:
 class TestProcessProfilePicture:
     """Tests for complete profile picture processing pipeline"""
     
-    def create_test_image_file(self, format='JPEG', size=(50, 50)):
-        """Helper to create a test image file"""
-        img = Image.new('RGB', size, color='blue')
-        output = BytesIO()
-        img.save(output, format=format)
-        output.seek(0)
-        if format == 'JPEG':
-            content_type = 'image/jpeg'
-            filename = 'test.jpg'
-        else:
-            content_type = 'image/png'
-            filename = 'test.png'
-        return SimpleUploadedFile(filename, output.read(), content_type=content_type)
-    
     @pytest.mark.django_db
-    def test_process_valid_jpeg(self):
+    def test_process_valid_jpeg(self, jpeg_bytes):
         """Test processing a valid JPEG file"""
-        file = self.create_test_image_file('JPEG', (50, 50))
+        file = SimpleUploadedFile('test.jpg', jpeg_bytes, content_type='image/jpeg')
         result = process_profile_picture(file)
         assert isinstance(result, InMemoryUploadedFile)
         assert result.name.endswith('.jpg')
@@ -202,18 +231,39 @@ class TestProcessProfilePicture:
         assert result.size > 0
     
     @pytest.mark.django_db
-    def test_process_valid_png_converts_to_jpeg(self):
+    def test_process_valid_png_converts_to_jpeg(self, png_bytes):
         """Test that PNG files are converted to JPEG"""
-        file = self.create_test_image_file('PNG', (50, 50))
+        file = SimpleUploadedFile('test.png', png_bytes, content_type='image/png')
         result = process_profile_picture(file)
         assert isinstance(result, InMemoryUploadedFile)
         assert result.name.endswith('.jpg')
         assert result.content_type == 'image/jpeg'
     
     @pytest.mark.django_db
-    def test_process_large_image_resizes(self):
+    def test_process_clean_small_jpeg_stored_unchanged(self, jpeg_bytes):
+        """Test that small JPEGs without metadata skip re-encoding"""
+        file = SimpleUploadedFile('test.jpg', jpeg_bytes, content_type='image/jpeg')
+        result = process_profile_picture(file)
+        result.seek(0)
+        assert result.read() == jpeg_bytes
+    
+    @pytest.mark.django_db
+    def test_process_small_jpeg_with_exif_is_reencoded(self):
+        """Test that EXIF data is still stripped from small JPEGs"""
+        exif = Image.Exif()
+        exif[0x010F] = 'Test Camera'  # Make
+        output = BytesIO()
+        Image.new('RGB', (50, 50), color='blue').save(output, format='JPEG', exif=exif)
+        file = SimpleUploadedFile('test.jpg', output.getvalue(), content_type='image/jpeg')
+        
+        result = process_profile_picture(file)
+        result.seek(0)
+        assert 'exif' not in Image.open(result).info
+    
+    @pytest.mark.django_db
+    def test_process_large_image_resizes(self, large_jpeg_bytes):
         """Test that large images are resized during processing"""
-        file = self.create_test_image_file('JPEG', (500, 500))
+        file = SimpleUploadedFile('test.jpg', large_jpeg_bytes, content_type='image/jpeg')
         result = process_profile_picture(file)
         # Verify the image was resized by checking it can be opened
         result.seek(0)
@@ -237,11 +287,24 @@ class TestProcessProfilePicture:
             process_profile_picture(large_file)
     
     @pytest.mark.django_db
-    def test_process_filename_sanitized(self):
+    def test_process_filename_sanitized(self, jpeg_bytes):
         """Test that filename is sanitized during processing"""
-        file = self.create_test_image_file('JPEG', (50, 50))
-        file.name = "../../../etc/passwd.jpg"
+        file = SimpleUploadedFile("../../../etc/passwd.jpg", jpeg_bytes, content_type="image/jpeg")
         result = process_profile_picture(file)
         assert "../" not in result.name
         assert result.name == "passwd.jpg"
-
+    
+    @pytest.mark.django_db
+    def test_process_transparent_png_flattened_and_resized(self):
+        """Test that a transparent PNG is flattened onto white, downscaled and re-encoded as JPEG"""
+        output = BytesIO()
+        Image.new('RGBA', (500, 250), (255, 0, 0, 0)).save(output, format='PNG')
+        file = SimpleUploadedFile('test.png', output.getvalue(), content_type='image/png')
+        result = process_profile_picture(file)
+        result.seek(0)
+        img = Image.open(result)
+        assert img.format == 'JPEG'
+        assert img.mode == 'RGB'
+        assert img.size == (MAX_WIDTH, MAX_HEIGHT // 2)
+        # Fully transparent pixels end up on the white background
+        assert all(channel > 245 for channel in img.getpixel((50, 25)))
@@ -4,7 +4,9 @@ Session management utilities for IP extraction and User-Agent parsing.
 """
 import os
 import re
+from functools import lru_cache
 from io import BytesIO
+from types import MappingProxyType
 from PIL import Image
 from django.core.files.uploadedfile import InMemoryUploadedFile
 from django.core.exceptions import ValidationError
@@ -20,8 +22,17 @@ except ImportError:
 MAX_FILE_SIZE = 1024 * 1024  # 1MB in bytes
 MAX_WIDTH = 100
 MAX_HEIGHT = 100
-ALLOWED_MIME_TYPES = ['image/jpeg', 'image/jpg', 'image/png']
-ALLOWED_EXTENSIONS = ['.jpg', '.jpeg', '.png']
+ALLOWED_MIME_TYPES = frozenset({'image/jpeg', 'image/jpg', 'image/png'})
+ALLOWED_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png'})
+# Leading "magic" bytes of each accepted image format
+IMAGE_SIGNATURES = {
+    b'\xff\xd8\xff': 'JPEG',
+    b'\x89PNG\r\n\x1a\n': 'PNG',
+}
+UA_CACHE_SIZE = 4096  # Distinct User-Agent strings kept in the parse cache
+
+# Characters stripped from uploaded filenames
+_FILENAME_RE = re.compile(r'[^a-zA-Z0-9._-]')
 
 
 def sanitize_filename(filename):
@@ -32,7 +43,7 @@ def sanitize_filename(filename):
     # Remove path components
     filename = os.path.basename(filename)
     # Remove any non-alphanumeric characters except dots, hyphens, underscores
-    filename = re.sub(r'[^a-zA-Z0-9._-]', '', filename)
+    filename = _FILENAME_RE.sub('', filename)
     # Limit length
     if len(filename) > 255:
         name, ext = os.path.splitext(filename)
@@ -40,6 +51,27 @@ def sanitize_filename(filename):
     return filename
 
 
+def sniff_image_format(file):
+    """
+    Identify the image format from the file's leading bytes.
+    
+    Unlike content_type and the filename, this can't be chosen by the client.
+    
+    Args:
+        file: Django UploadedFile object
+        
+    Returns:
+        str: 'JPEG' or 'PNG', or None for anything else
+    """
+    file.seek(0)
+    head = file.read(8)
+    file.seek(0)
+    for signature, image_format in IMAGE_SIGNATURES.items():
+        if head.startswith(signature):
+            return image_format
+    return None
+
+
 def validate_image_file(file):
     """
     Validate uploaded image file for security.
@@ -47,6 +79,7 @@ def validate_image_file(file):
     Checks:
     - File size (must be <= 1MB)
     - MIME type (must be JPEG or PNG)
+    - Magic bytes (content must really be JPEG or PNG)
     - Actual image content (not just file extension)
     
     Note: Image dimensions are not checked here - oversized images will be
@@ -75,25 +108,28 @@ def validate_image_file(file):
     if ext not in ALLOWED_EXTENSIONS:
         return None, f"Invalid file extension. Allowed extensions: .jpg, .jpeg, .png"
     
+    # The headers above are client-supplied; check the content itself before
+    # spending any time decoding it
+    image_format = sniff_image_format(file)
+    if image_format is None:
+        return None, f"Invalid file type. Allowed types: JPEG, PNG"
+    
     try:
-        # Open and verify it's actually an image
-        # Reset file pointer to beginning
-        file.seek(0)
-        image = Image.open(file)
-        
-        # Verify image format
-        if image.format not in ['JPEG', 'PNG']:
-            return None, "Invalid image format. Only JPEG and PNG are allowed."
+        # Open and verify it's actually an image; only the sniffed format's
+        # plugin is tried, so Pillow doesn't probe every other format
+        image = Image.open(file, formats=[image_format])
         
         # Note: Dimensions are not checked here - images will be automatically resized
         # to MAX_WIDTH x MAX_HEIGHT in the sanitize_image function
         
-        # Verify image is not corrupted
-        image.verify()
+        # Let libjpeg decode large JPEGs at 1/2, 1/4 or 1/8 scale; keeping at
+        # least twice the target size leaves LANCZOS enough pixels to work with
+        if image.format == 'JPEG':
+            image.draft('RGB', (MAX_WIDTH * 2, MAX_HEIGHT * 2))
         
-        # Reopen image after verify() (verify() closes the image)
-        file.seek(0)
-        image = Image.open(file)
+        # Decode once to verify the image is not corrupted; unlike verify(),
+        # this leaves the image usable by sanitize_image without reopening
+        image.load()
         
         return image, None
         
@@ -105,12 +141,18 @@ def sanitize_image(image):
     """
     Sanitize image by removing EXIF data, resizing, and converting to RGB.
     
+    Oversized images are resized in place, so pass an image you own.
+    
     Args:
         image: PIL Image object
         
     Returns:
         PIL Image object: Sanitized image
     """
+    # Already-small RGB images (e.g. pre-cropped avatars) need no work
+    if image.mode == 'RGB' and image.width <= MAX_WIDTH and image.height <= MAX_HEIGHT:
+        return image
+    
     # Convert to RGB to remove alpha channel and ensure compatibility
     if image.mode in ('RGBA', 'LA', 'P'):
         # Create a white background for transparent images
@@ -122,15 +164,9 @@ def sanitize_image(image):
     elif image.mode != 'RGB':
         image = image.convert('RGB')
     
-    # Resize if needed while maintaining aspect ratio
-    width, height = image.size
-    
-    if width > MAX_WIDTH or height > MAX_HEIGHT:
-        # Calculate new dimensions maintaining aspect ratio
-        ratio = min(MAX_WIDTH / width, MAX_HEIGHT / height)
-        new_width = int(width * ratio)
-        new_height = int(height * ratio)
-        image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+    # Resize if needed while maintaining aspect ratio; thumbnail() works in
+    # place and never upscales
+    image.thumbnail((MAX_WIDTH, MAX_HEIGHT), Image.Resampling.LANCZOS)
     
     # Return the sanitized image directly
     # The image has already been converted to RGB and resized
@@ -138,6 +174,32 @@ def sanitize_image(image):
     return image
 
 
+def is_clean_small_jpeg(image, data):
+    """
+    Check whether an upload can be stored without re-encoding.
+    
+    True for an RGB JPEG already within MAX_WIDTH x MAX_HEIGHT whose only
+    marker segment is the JFIF header, so there is no EXIF, XMP, ICC profile,
+    comment or data after the end-of-image marker to strip.
+    
+    Args:
+        image: PIL Image object opened from data
+        data: Raw bytes of the upload
+        
+    Returns:
+        bool: True if data can be stored as-is
+    """
+    return (
+        image.format == 'JPEG'
+        and image.mode == 'RGB'
+        and image.width <= MAX_WIDTH
+        and image.height <= MAX_HEIGHT
+        and all(marker == 'APP0' and segment.startswith(b'JFIF\x00') for marker, segment in image.applist)
+        and 'comment' not in image.info
+        and data.endswith(b'\xff\xd9')
+    )
+
+
 def process_profile_picture(file):
     """
     Complete processing pipeline for profile picture upload.
@@ -162,18 +224,25 @@ def process_profile_picture(file):
     if error:
         raise ValidationError(error)
     
-    # Sanitize the image
-    sanitized_image = sanitize_image(image)
-    
-    # Convert to file-like object
-    output = BytesIO()
-    sanitized_image.save(output, format='JPEG', quality=85, optimize=True)
+    # Sanitize the image and convert to file-like object
+    file.seek(0)
+    data = file.read()
+    if is_clean_small_jpeg(image, data):
+        # Pre-cropped avatars with nothing to strip are stored untouched,
+        # skipping the resize and JPEG re-encode entirely
+        output = BytesIO(data)
+        output.seek(0, os.SEEK_END)
+    else:
+        output = BytesIO()
+        sanitized_image = sanitize_image(image)
+        # No optimize pass: for a <=100px thumbnail the second Huffman pass
+        # costs more CPU than the few hundred bytes it saves
+        sanitized_image.save(output, format='JPEG', quality=85)
     
-    # Get the actual size of the content (before seeking)
+    # Size of the encoded content; the buffer position is at its end
     file_size = output.tell()
-    
-    # Reset to beginning for InMemoryUploadedFile
-    output.seek(0)
+    if file_size == 0:
+        raise ValidationError("Processed image has no content")
     
     # Create a new InMemoryUploadedFile
     filename = sanitize_filename(file.name)
@@ -182,24 +251,14 @@ def process_profile_picture(file):
     if ext.lower() not in ['.jpg', '.jpeg']:
         filename = f"{name}.jpg"
     
-    # Ensure the BytesIO is at the beginning and has content
-    output.seek(0)
-    content = output.read()
+    # Hand the encode buffer over directly rather than copying its bytes
     output.seek(0)
-    
-    # Verify we have content
-    if len(content) == 0:
-        raise ValidationError("Processed image has no content")
-    
-    # Create a new BytesIO from the content to ensure it's fresh
-    fresh_output = BytesIO(content)
-    
     processed_file = InMemoryUploadedFile(
-        fresh_output,
+        output,
         'ImageField',
         filename,
         'image/jpeg',
-        len(content),
+        file_size,
         None
     )
     
@@ -223,9 +282,9 @@ def get_client_ip(request):
     """
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
     if x_forwarded_for:
-        # X-Forwarded-For can contain multiple IPs, take the first one
-        ip = x_forwarded_for.split(',')[0].strip()
-        return ip
+        # X-Forwarded-For can contain multiple IPs, take the first one;
+        # partition stops at the first comma without building a list
+        return x_forwarded_for.partition(',')[0].strip()
     
     x_real_ip = request.META.get('HTTP_X_REAL_IP')
     if x_real_ip:
@@ -234,17 +293,20 @@ def get_client_ip(request):
     return request.META.get('REMOTE_ADDR', '0.0.0.0')
 
 
+@lru_cache(maxsize=UA_CACHE_SIZE)
 def parse_user_agent(user_agent_string):
     """
     Parse User-Agent string to extract browser, device, and OS information.
     
     Uses user-agents library if available, falls back to basic parsing.
+    Results are cached per User-Agent string, so the returned mapping is
+    read-only; copy it with dict() before modifying.
     
     Args:
         user_agent_string: Raw User-Agent string
         
     Returns:
-        dict: {
+        mapping: {
             'browser_name': str,
             'browser_version': str or None,
             'os_name': str,
@@ -253,6 +315,11 @@ def parse_user_agent(user_agent_string):
             'device_name': str or None
         }
     """
+    return MappingProxyType(_parse_user_agent(user_agent_string))
+
+
+def _parse_user_agent(user_agent_string):
+    """Uncached User-Agent parsing behind parse_user_agent"""
     if not user_agent_string:
         return {
             'browser_name': 'Unknown',
@@ -344,11 +411,19 @@ def parse_user_agent(user_agent_string):
         }
 
 
+# Version patterns used by the fallback parser, compiled once per keyword
+_VERSION_PATTERNS = {
+    keyword: re.compile(rf'{re.escape(keyword)}[\/\s]+([\d\.]+)', re.IGNORECASE)
+    for keyword in (
+        'chrome', 'firefox', 'version', 'edg',
+        'windows nt', 'mac os x', 'android', 'os ',
+    )
+}
+
+
 def _extract_version(ua_string, keyword):
     """Helper to extract version number from user agent string"""
-    import re
-    pattern = rf'{re.escape(keyword)}[\/\s]+([\d\.]+)'
-    match = re.search(pattern, ua_string, re.IGNORECASE)
+    match = _VERSION_PATTERNS[keyword].search(ua_string)
     if match:
         return match.group(1)
     return None
@@ -371,8 +446,9 @@ def can_delete_session(user, current_session, target_session):
     Returns:
         bool: True if deletion is allowed, False otherwise
     """
-    # Both sessions must belong to the same user
-    if current_session.user != user or target_session.user != user:
+    # Both sessions must belong to the same user; compare FK ids so the
+    # sessions' users are never loaded
+    if current_session.user_id != user.id or target_session.user_id != user.id:
         return False
     
     # Cannot delete the same session
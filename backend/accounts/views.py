@@ -4,21 +4,23 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 from accounts.models import UserSession
 from accounts.serializers import (
     UserSessionSerializer,
     UserSessionListSerializer,
     AdminUserSessionListSerializer,
+    SessionUserSerializer,
     UserSessionCreateSerializer
 )
 from accounts.utils import can_delete_session
-from jwt import decode as jwt_decode
-from django.conf import settings
+from rest_framework_simplejwt.settings import api_settings
 
 
 class CanDeleteSessionPermission(permissions.BasePermission):
     """Permission to check if user can delete a session"""
+    message = 'شما نمی‌توانید این جلسه را حذف کنید. فقط جلسات قدیمی‌تر می‌توانند جلسات جدیدتر را حذف کنند.'
     
     def has_object_permission(self, request, view, obj):
         # Admins can delete any session
@@ -26,28 +28,29 @@ class CanDeleteSessionPermission(permissions.BasePermission):
             return True
         
         # Users can only delete their own sessions
-        if obj.user != request.user:
+        if obj.user_id != request.user.id:
             return False
         
-        # Get current session's JTI from token
+        # JWTAuthentication has already verified the token, so read the JTI
+        # from it instead of decoding the Authorization header again
+        current_jti = request.auth.get(api_settings.JTI_CLAIM) if request.auth else None
+        
+        # A session can never delete itself (logout has its own endpoint), so
+        # refuse that without looking the current session up
+        if obj.token_jti == current_jti:
+            return False
+        
+        # Find current session; can_delete_session only reads these columns
         try:
-            auth_header = request.META.get('HTTP_AUTHORIZATION', '')
-            if auth_header.startswith('Bearer '):
-                token = auth_header.split(' ')[1]
-                decoded = jwt_decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-                current_jti = decoded.get('jti')
-                
-                # Find current session
-                try:
-                    current_session = UserSession.objects.get(token_jti=current_jti, user=request.user)
-                    # Check if current session can delete target session
-                    return can_delete_session(request.user, current_session, obj)
-                except UserSession.DoesNotExist:
-                    return False
-        except Exception:
+            current_session = UserSession.objects.only('id', 'user_id', 'login_date').get(
+                token_jti=current_jti, user=request.user
+            )
+        except UserSession.DoesNotExist:
+            self.message = 'جلسه فعلی یافت نشد.'
             return False
         
-        return False
+        # Check if current session can delete target session
+        return can_delete_session(request.user, current_session, obj)
 
 
 class UserSessionViewSet(viewsets.ModelViewSet):
@@ -57,7 +60,11 @@ class UserSessionViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         """Return sessions for the current user"""
-        return UserSession.objects.filter(user=self.request.user, is_active=True)
+        queryset = UserSession.objects.filter(user=self.request.user, is_active=True)
+        if self.action == 'list':
+            # Skip columns the list serializer never renders (user_agent, JTIs, ...)
+            queryset = queryset.only('user', *UserSessionListSerializer.Meta.fields)
+        return queryset
 
     def get_object(self):
         """Get session object - allow any session for permission checking"""
@@ -82,51 +89,18 @@ class UserSessionViewSet(viewsets.ModelViewSet):
 
     def check_object_permissions(self, request, obj):
         """Check permissions for object-level operations"""
-        # Check if user owns the session or is admin
-        if obj.user != request.user and not request.user.is_staff:
+        # Check if user owns the session or is admin; compare the FK id so
+        # the session's user isn't loaded just for this check
+        if obj.user_id != request.user.id and not request.user.is_staff:
             from rest_framework.exceptions import PermissionDenied
             raise PermissionDenied('شما دسترسی به این جلسه را ندارید.')
+        # Then the action's own permissions (CanDeleteSessionPermission for destroy)
+        super().check_object_permissions(request, obj)
     
     def destroy(self, request, *args, **kwargs):
         """Delete session - only if allowed by permission"""
+        # get_object() runs the ownership and CanDeleteSessionPermission checks
         session = self.get_object()
-        
-        # Check if user owns the session
-        if session.user != request.user and not request.user.is_staff:
-            return Response(
-                {'detail': 'شما دسترسی به این جلسه را ندارید.'},
-                status=status.HTTP_403_FORBIDDEN
-            )
-        
-        # For non-admin users, check if current session can delete target session
-        if not request.user.is_staff:
-            try:
-                auth_header = request.META.get('HTTP_AUTHORIZATION', '')
-                if auth_header.startswith('Bearer '):
-                    token = auth_header.split(' ')[1]
-                    decoded = jwt_decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-                    current_jti = decoded.get('jti')
-                    
-                    # Find current session
-                    try:
-                        current_session = UserSession.objects.get(token_jti=current_jti, user=request.user)
-                        # Check if current session can delete target session
-                        if not can_delete_session(request.user, current_session, session):
-                            return Response(
-                                {'detail': 'شما نمی‌توانید این جلسه را حذف کنید. فقط جلسات قدیمی‌تر می‌توانند جلسات جدیدتر را حذف کنند.'},
-                                status=status.HTTP_403_FORBIDDEN
-                            )
-                    except UserSession.DoesNotExist:
-                        return Response(
-                            {'detail': 'جلسه فعلی یافت نشد.'},
-                            status=status.HTTP_403_FORBIDDEN
-                        )
-            except Exception as e:
-                return Response(
-                    {'detail': 'خطا در بررسی دسترسی.'},
-                    status=status.HTTP_403_FORBIDDEN
-                )
-        
         session.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
     
@@ -136,7 +110,7 @@ class UserSessionViewSet(viewsets.ModelViewSet):
         session = self.get_object()
         
         # Check ownership
-        if session.user != request.user:
+        if session.user_id != request.user.id:
             return Response(
                 {'detail': 'شما دسترسی به این جلسه را ندارید.'},
                 status=status.HTTP_403_FORBIDDEN
@@ -144,15 +118,17 @@ class UserSessionViewSet(viewsets.ModelViewSet):
         
         serializer = UserSessionCreateSerializer(data=request.data)
         if serializer.is_valid():
-            screen_width = serializer.validated_data.get('screen_width')
-            screen_height = serializer.validated_data.get('screen_height')
-            
-            if screen_width is not None:
-                session.screen_width = screen_width
-            if screen_height is not None:
-                session.screen_height = screen_height
+            updates = {'last_activity': timezone.now()}
+            for field in ('screen_width', 'screen_height'):
+                value = serializer.validated_data.get(field)
+                if value is not None:
+                    updates[field] = value
             
-            session.save(update_fields=['screen_width', 'screen_height', 'last_activity'])
+            # A queryset update writes only the changed columns and skips the
+            # model save machinery; mirror the values on the loaded instance
+            UserSession.objects.filter(pk=session.pk).update(**updates)
+            for field, value in updates.items():
+                setattr(session, field, value)
             
             return Response(UserSessionSerializer(session).data)
         
@@ -171,6 +147,11 @@ class AdminUserSessionViewSet(viewsets.ModelViewSet):
         user_id = self.request.query_params.get('user_id')
         if user_id:
             queryset = queryset.filter(user_id=user_id)
+        if self.action == 'list':
+            queryset = AdminUserSessionListSerializer.setup_eager_loading(queryset).only(
+                *AdminUserSessionListSerializer.Meta.fields,
+                *(f'user__{field}' for field in SessionUserSerializer.Meta.fields)
+            )
         return queryset
 
     def get_serializer_class(self):
@@ -58,6 +58,94 @@ def authenticated_admin_client(api_client, admin_user):
     return api_client
 
 
+@pytest.fixture
+def make_sessions():
+    """
+    Factory fixture creating UserSession rows for a user in one bulk INSERT.
+    Each spec is a dict of field overrides; a 'login_date' key is written
+    in the same INSERT even though the field is auto_now_add.
+    """
+    from django.utils import timezone
+    from accounts.models import UserSession
+
+    defaults = {
+        'ip_address': '192.168.1.1',
+        'user_agent': 'Test',
+        'browser_name': 'Chrome',
+        'device_type': 'desktop',
+        'os_name': 'Windows',
+    }
+    login_date_field = UserSession._meta.get_field('login_date')
+
+    def _make_sessions(user, specs):
+        now = timezone.now()
+        sessions = [
+            UserSession(user=user, **{**defaults, 'login_date': now, **spec})
+            for spec in specs
+        ]
+        # auto_now_add would overwrite preset login dates in pre_save
+        login_date_field.auto_now_add = False
+        try:
+            return UserSession.objects.bulk_create(sessions)
+        finally:
+            login_date_field.auto_now_add = True
+
+    return _make_sessions
+
+
+@pytest.fixture
+def latest_session_snapshot():
+    """
+    Helper returning (session_count, newest_session) for a user.
+    The count comes from a window aggregate so both are read in one query.
+    """
+    from django.db.models import Count, Window
+    from accounts.models import UserSession
+
+    def _latest_session_snapshot(user):
+        session = (
+            UserSession.objects.filter(user=user)
+            .annotate(session_count=Window(Count('id')))
+            .order_by('-login_date')
+            .first()
+        )
+        if session is None:
+            return 0, None
+        return session.session_count, session
+
+    return _latest_session_snapshot
+
+
+@pytest.fixture(scope='class')
+def baseline_session(django_db_setup, django_db_blocker):
+    """
+    Read-only UserSession shared by every test in a class.
+    Created once outside the per-test transaction and removed at class
+    teardown, so tests using it must not modify the row.
+    """
+    from accounts.models import UserSession
+
+    with django_db_blocker.unblock():
+        # get_or_create so a row left behind by an interrupted run on a
+        # reused test database doesn't break the next one
+        user, _ = User.objects.get_or_create(username='baseline_session_user')
+        session, _ = UserSession.objects.get_or_create(
+            user=user,
+            token_jti='baseline-jti',
+            defaults={
+                'ip_address': '192.168.1.1',
+                'user_agent': 'Mozilla/5.0 Test',
+                'browser_name': 'Chrome',
+                'device_type': 'desktop',
+                'os_name': 'Windows',
+            },
+        )
+    yield session
+    with django_db_blocker.unblock():
+        # Cascades to the session and the user's profile
+        user.delete()
+
+
 @pytest.fixture
 def domain():
     """Domain fixture"""
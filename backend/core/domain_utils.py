@@ -23,6 +23,19 @@ def get_user_accessible_domain_ids(user):
     return user_domain.get_all_descendant_ids()
 
 
+def get_user_accessible_domains(user):
+    """
+    Get a lazy queryset of the domains a user can access (their domain and all subdomains).
+    Returns an empty queryset if user has no domain.
+    """
+    user_domain = get_user_domain(user)
+    if not user_domain:
+        return Domain.objects.none()
+    return Domain.objects.filter(
+        Q(pk=user_domain.pk) | Q(path__startswith=f"{user_domain.path}{user_domain.id}/")
+    )
+
+
 def filter_by_domain(queryset, user, domain_field='domain'):
     """
     Filter a queryset to only include items accessible by the user's domain.
@@ -31,12 +44,12 @@ def filter_by_domain(queryset, user, domain_field='domain'):
     if user.is_staff:
         return queryset
     
-    accessible_domain_ids = get_user_accessible_domain_ids(user)
-    if not accessible_domain_ids:
+    if not get_user_domain(user):
         # User has no domain, return empty queryset
         return queryset.none()
     
-    return queryset.filter(**{f'{domain_field}__id__in': accessible_domain_ids})
+    # Filter through a subquery so the descendant IDs never round-trip through Python
+    return queryset.filter(**{f'{domain_field}__in': get_user_accessible_domains(user)})
 
 
 def user_can_access_domain(user, domain):
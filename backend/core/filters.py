@@ -3,9 +3,15 @@ from django.contrib.auth.models import User
 from .models import Project, Task, WorkingDay, Report, Feedback, StatusChoices, ReportResultChoices, FeedbackTypeChoices
 
 
+# Built once and shared by every FilterSet that filters on the same enum
+STATUS_CHOICES = tuple((s.value, s.name) for s in StatusChoices)
+REPORT_RESULT_CHOICES = tuple((r.value, r.name) for r in ReportResultChoices)
+FEEDBACK_TYPE_CHOICES = tuple((t.value, t.name) for t in FeedbackTypeChoices)
+
+
 class ProjectFilter(django_filters.FilterSet):
     name = django_filters.CharFilter(lookup_expr='icontains')
-    status = django_filters.ChoiceFilter(choices=[(s.value, s.name) for s in StatusChoices])
+    status = django_filters.ChoiceFilter(choices=STATUS_CHOICES)
     start_date = django_filters.DateFilter()
     start_date__gte = django_filters.DateFilter(field_name='start_date', lookup_expr='gte')
     start_date__lte = django_filters.DateFilter(field_name='start_date', lookup_expr='lte')
@@ -20,7 +26,7 @@ class ProjectFilter(django_filters.FilterSet):
 
 class TaskFilter(django_filters.FilterSet):
     name = django_filters.CharFilter(lookup_expr='icontains')
-    status = django_filters.ChoiceFilter(choices=[(s.value, s.name) for s in StatusChoices])
+    status = django_filters.ChoiceFilter(choices=STATUS_CHOICES)
     phase = django_filters.NumberFilter()
     is_draft = django_filters.BooleanFilter()
     project = django_filters.NumberFilter()
@@ -52,7 +58,7 @@ class WorkingDayFilter(django_filters.FilterSet):
 class ReportFilter(django_filters.FilterSet):
     working_day = django_filters.NumberFilter()
     task = django_filters.NumberFilter()
-    result = django_filters.ChoiceFilter(choices=[(r.value, r.name) for r in ReportResultChoices])
+    result = django_filters.ChoiceFilter(choices=REPORT_RESULT_CHOICES)
     start_time = django_filters.DateTimeFilter()
     start_time__gte = django_filters.DateTimeFilter(field_name='start_time', lookup_expr='gte')
     start_time__lte = django_filters.DateTimeFilter(field_name='start_time', lookup_expr='lte')
@@ -67,7 +73,7 @@ class ReportFilter(django_filters.FilterSet):
 
 class FeedbackFilter(django_filters.FilterSet):
     user = django_filters.NumberFilter()
-    type = django_filters.ChoiceFilter(choices=[(t.value, t.name) for t in FeedbackTypeChoices])
+    type = django_filters.ChoiceFilter(choices=FEEDBACK_TYPE_CHOICES)
     created_at = django_filters.DateTimeFilter()
     created_at__gte = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='gte')
     created_at__lte = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='lte')
@@ -3,9 +3,22 @@ Jalali (Persian) calendar utility functions for report generation.
 """
 import jdatetime
 from datetime import datetime, date, timedelta
+from functools import lru_cache
 from django.utils import timezone
 
 
+# Period boundaries are pure calendar math, so they are cached as plain
+# Gregorian dates; the timezone-aware datetimes are built per call because
+# they depend on the active timezone
+PERIOD_CACHE_SIZE = 4096
+
+# Indexed by Jalali month number (1-12)
+JALALI_MONTH_NAMES = (
+    '', 'فروردین', 'اردیبهشت', 'خرداد', 'تیر', 'مرداد', 'شهریور',
+    'مهر', 'آبان', 'آذر', 'دی', 'بهمن', 'اسفند'
+)
+
+
 def get_current_jalali_date():
     """Get current Jalali date as a dictionary"""
     now = jdatetime.datetime.now()
@@ -43,25 +56,49 @@ def gregorian_to_jalali(g_date):
     }
 
 
+@lru_cache(maxsize=PERIOD_CACHE_SIZE)
+def _jalali_week_number_offset(year):
+    """Days from the Saturday that starts week 1 to 1 Farvardin"""
+    year_start = jdatetime.date(year, 1, 1)
+    return (year_start.weekday() + 2) % 7  # Saturday = 6, so +2 to map correctly
+
+
 def get_jalali_week_number(year, month, day):
     """Get week number in Jalali year (1-based, week starts on Saturday)"""
-    j_date = jdatetime.date(year, month, day)
-    year_start = jdatetime.date(year, 1, 1)
-    # Find the first Saturday of the year (week starts on Saturday in Jalali calendar)
-    days_since_saturday = (year_start.weekday() + 2) % 7  # Saturday = 6, so +2 to map correctly
-    first_saturday = year_start - timedelta(days=days_since_saturday)
-    
-    if j_date < first_saturday:
-        # If date is before first Saturday, it belongs to week 0 or previous year's last week
-        return 0
-    
-    days_diff = (j_date - first_saturday).days
-    week_number = (days_diff // 7) + 1
-    return week_number
+    if not 1 <= month <= 12 or not 1 <= day <= get_jalali_month_length(year, month):
+        raise ValueError(f"Invalid Jalali date: {year}/{month}/{day}")
+    # Months 1-6 have 31 days and 7-11 have 30, so the day of year is closed form
+    day_of_year = (month - 1) * 31 - max(month - 7, 0) + day
+    # Week 1 starts on or before 1 Farvardin, so no date falls before it
+    return (day_of_year - 1 + _jalali_week_number_offset(year)) // 7 + 1
+
+
+def _day_bounds(start_date, end_date):
+    """Make timezone-aware datetimes spanning start_date 00:00 to end_date 23:59:59.999999"""
+    start_datetime = timezone.make_aware(datetime.combine(start_date, datetime.min.time()))
+    end_datetime = timezone.make_aware(datetime.combine(end_date, datetime.max.time()))
+    return start_datetime, end_datetime
 
 
-def get_jalali_week_start_end(year, week):
-    """Get start and end dates (Gregorian) for a Jalali week"""
+@lru_cache(maxsize=PERIOD_CACHE_SIZE)
+def is_jalali_leap_year(year):
+    """Check if a Jalali year is a leap year (Esfand has 30 days)"""
+    return jdatetime.date(year, 1, 1).isleap()
+
+
+def get_jalali_month_length(year, month):
+    """Get the number of days in a Jalali month"""
+    if month <= 6:
+        return 31
+    if month <= 11:
+        return 30
+    # month == 12 (Esfand)
+    return 30 if is_jalali_leap_year(year) else 29
+
+
+@lru_cache(maxsize=PERIOD_CACHE_SIZE)
+def _jalali_week_dates(year, week):
+    """Get the first and last Gregorian dates of a Jalali week"""
     year_start = jdatetime.date(year, 1, 1)
     # Find the Saturday on or before 1 Farvardin (week numbering starts there)
     # weekday(): Saturday=0, ..., Friday=6 (jdatetime)
@@ -73,46 +110,34 @@ def get_jalali_week_start_end(year, week):
     # Week end is Friday (6 days after Saturday)
     week_end_jalali = week_start_jalali + timedelta(days=6)
     
-    # Convert to Gregorian
-    week_start_gregorian = week_start_jalali.togregorian()
-    week_end_gregorian = week_end_jalali.togregorian()
-    
-    # Make datetime objects with time boundaries
-    start_datetime = timezone.make_aware(datetime.combine(week_start_gregorian, datetime.min.time()))
-    end_datetime = timezone.make_aware(datetime.combine(week_end_gregorian, datetime.max.time()))
-    
-    return start_datetime, end_datetime
+    return week_start_jalali.togregorian(), week_end_jalali.togregorian()
+
+
+@lru_cache(maxsize=PERIOD_CACHE_SIZE)
+def _jalali_month_dates(year, month):
+    """Get the first and last Gregorian dates of a Jalali month"""
+    month_start_jalali = jdatetime.date(year, month, 1)
+    month_end_jalali = jdatetime.date(year, month, get_jalali_month_length(year, month))
+    return month_start_jalali.togregorian(), month_end_jalali.togregorian()
+
+
+@lru_cache(maxsize=PERIOD_CACHE_SIZE)
+def _jalali_year_dates(year):
+    """Get the first and last Gregorian dates of a Jalali year"""
+    year_start_jalali = jdatetime.date(year, 1, 1)
+    year_end_jalali = jdatetime.date(year, 12, get_jalali_month_length(year, 12))
+    return year_start_jalali.togregorian(), year_end_jalali.togregorian()
+
+
+def get_jalali_week_start_end(year, week):
+    """Get start and end dates (Gregorian) for a Jalali week"""
+    return _day_bounds(*_jalali_week_dates(year, week))
 
 
 def get_jalali_month_start_end(year, month):
     """Get start and end dates (Gregorian) for a Jalali month"""
     try:
-        month_start_jalali = jdatetime.date(year, month, 1)
-        # Get last day of month
-        if month <= 6:
-            days_in_month = 31
-        elif month <= 11:
-            days_in_month = 30
-        else:  # month == 12 (Esfand)
-            # Check if it's a leap year by trying to create Esfand 30
-            # If it succeeds, it's a leap year (30 days), otherwise 29 days
-            try:
-                test_date = jdatetime.date(year, 12, 30)
-                days_in_month = 30  # Leap year
-            except ValueError:
-                days_in_month = 29  # Not a leap year
-        
-        month_end_jalali = jdatetime.date(year, month, days_in_month)
-        
-        # Convert to Gregorian
-        month_start_gregorian = month_start_jalali.togregorian()
-        month_end_gregorian = month_end_jalali.togregorian()
-        
-        # Make datetime objects with time boundaries
-        start_datetime = timezone.make_aware(datetime.combine(month_start_gregorian, datetime.min.time()))
-        end_datetime = timezone.make_aware(datetime.combine(month_end_gregorian, datetime.max.time()))
-        
-        return start_datetime, end_datetime
+        return _day_bounds(*_jalali_month_dates(year, month))
     except ValueError as e:
         raise ValueError(f"Invalid Jalali month: {year}/{month} - {e}")
 
@@ -120,25 +145,7 @@ def get_jalali_month_start_end(year, month):
 def get_jalali_year_start_end(year):
     """Get start and end dates (Gregorian) for a Jalali year"""
     try:
-        year_start_jalali = jdatetime.date(year, 1, 1)
-        year_end_jalali = jdatetime.date(year, 12, 29)  # Start with Esfand 29
-        
-        # Check if it's a leap year by trying to create Esfand 30
-        try:
-            test_date = jdatetime.date(year, 12, 30)
-            year_end_jalali = test_date
-        except ValueError:
-            pass  # Not a leap year, use Esfand 29
-        
-        # Convert to Gregorian
-        year_start_gregorian = year_start_jalali.togregorian()
-        year_end_gregorian = year_end_jalali.togregorian()
-        
-        # Make datetime objects with time boundaries
-        start_datetime = timezone.make_aware(datetime.combine(year_start_gregorian, datetime.min.time()))
-        end_datetime = timezone.make_aware(datetime.combine(year_end_gregorian, datetime.max.time()))
-        
-        return start_datetime, end_datetime
+        return _day_bounds(*_jalali_year_dates(year))
     except ValueError as e:
         raise ValueError(f"Invalid Jalali year: {year} - {e}")
 
@@ -160,11 +167,8 @@ def get_jalali_date_range(period_type, year, month=None, day=None, week=None):
     if period_type == 'daily':
         if month is None or day is None:
             raise ValueError("month and day are required for daily period")
-        jalali_date = jdatetime.date(year, month, day)
-        gregorian_date = jalali_date.togregorian()
-        start_datetime = timezone.make_aware(datetime.combine(gregorian_date, datetime.min.time()))
-        end_datetime = timezone.make_aware(datetime.combine(gregorian_date, datetime.max.time()))
-        return start_datetime, end_datetime
+        gregorian_date = jdatetime.date(year, month, day).togregorian()
+        return _day_bounds(gregorian_date, gregorian_date)
     
     elif period_type == 'weekly':
         if week is None:
@@ -187,19 +191,11 @@ def get_jalali_date_range(period_type, year, month=None, day=None, week=None):
 def format_jalali_period(period_type, year, month=None, week=None, day=None):
     """Format a Jalali period as a human-readable string"""
     if period_type == 'daily':
-        month_names = [
-            '', 'فروردین', 'اردیبهشت', 'خرداد', 'تیر', 'مرداد', 'شهریور',
-            'مهر', 'آبان', 'آذر', 'دی', 'بهمن', 'اسفند'
-        ]
-        return f"{day} {month_names[month]} {year}"
+        return f"{day} {JALALI_MONTH_NAMES[month]} {year}"
     elif period_type == 'weekly':
         return f"هفته {week} سال {year}"
     elif period_type == 'monthly':
-        month_names = [
-            '', 'فروردین', 'اردیبهشت', 'خرداد', 'تیر', 'مرداد', 'شهریور',
-            'مهر', 'آبان', 'آذر', 'دی', 'بهمن', 'اسفند'
-        ]
-        return f"{month_names[month]} {year}"
+        return f"{JALALI_MONTH_NAMES[month]} {year}"
     elif period_type == 'yearly':
         return f"سال {year}"
     else:
@@ -3,14 +3,15 @@ Django management command to auto-generate saved reports.
 Should be run on schedule (weekly, monthly, yearly).
 """
 import jdatetime
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
 from django.utils import timezone
 from core.models import SavedReport, Domain
 from core.report_service import ReportService
-from core.pdf_service import generate_report_pdf
+from core.pdf_service import generate_report_pdf, get_pdf_assets
 from core.jalali_utils import get_current_jalali_date, get_jalali_date_range
-from django.core.files.base import ContentFile
+from django.core.files import File
+from django.db import transaction
 import json
 
 
@@ -75,23 +76,44 @@ class Command(BaseCommand):
             self.style.SUCCESS(f'Generating {period_type} reports for Jalali year {year}')
         )
         
+        # The period's date range and the PDF stylesheet/font are the same for
+        # every report, so prepare them once instead of per user and domain
+        try:
+            date_range = get_jalali_date_range(period_type, year, month=month, week=week)
+        except ValueError as e:
+            raise CommandError(f'Invalid {period_type} period: {e}')
+        try:
+            pdf_assets = get_pdf_assets()
+        except Exception as e:
+            raise CommandError(f'Could not load PDF stylesheet and fonts: {e}')
+        
+        # Reports already saved for this period, fetched once per report type
+        # so re-runs don't query once per user/domain
+        existing_reports = SavedReport.objects.filter(
+            period_type=period_type,
+            jalali_year=year,
+            jalali_month=month,
+            jalali_week=week,
+        )
+        
         # Generate individual reports for all active users
-        active_users = User.objects.filter(is_active=True)
-        individual_count = 0
+        # Load only what the loop and ReportService read from each user, with
+        # the profile's domain joined in, and stream the rows in chunks
+        active_users = (
+            User.objects.filter(is_active=True)
+            .only('id', 'username', 'first_name', 'last_name', 'profile__domain')
+            .select_related('profile__domain')
+            .iterator(chunk_size=500)
+        )
+        saved_reports = []
+        existing_user_ids = set(
+            existing_reports.filter(report_type='individual').values_list('user_id', flat=True)
+        )
         
         for user in active_users:
             try:
                 # Check if report already exists
-                existing = SavedReport.objects.filter(
-                    report_type='individual',
-                    period_type=period_type,
-                    jalali_year=year,
-                    jalali_month=month,
-                    jalali_week=week,
-                    user=user
-                ).first()
-                
-                if existing:
+                if user.id in existing_user_ids:
                     self.stdout.write(
                         self.style.WARNING(f'Report already exists for user {user.username}, skipping...')
                     )
@@ -99,14 +121,14 @@ class Command(BaseCommand):
                 
                 # Generate report data
                 report_data = ReportService.generate_individual_report(
-                    user, period_type, year, month=month, week=week
+                    user, period_type, year, month=month, week=week, date_range=date_range
                 )
                 
                 # Generate PDF
-                pdf_file = generate_report_pdf(report_data, report_type='individual')
+                pdf_file = generate_report_pdf(report_data, report_type='individual', assets=pdf_assets)
                 
-                # Create saved report
-                saved_report = SavedReport.objects.create(
+                # Store the PDF now and queue the row for the bulk INSERT
+                saved_report = SavedReport(
                     report_type='individual',
                     period_type=period_type,
                     jalali_year=year,
@@ -115,16 +137,14 @@ class Command(BaseCommand):
                     user=user,
                     report_data=report_data
                 )
-                
-                # Save PDF file
                 pdf_filename = f"report_individual_{user.id}_{year}_{period_type}.pdf"
                 saved_report.pdf_file.save(
                     pdf_filename,
-                    ContentFile(pdf_file.read()),
-                    save=True
+                    File(pdf_file),
+                    save=False
                 )
+                saved_reports.append((saved_report, user.username))
                 
-                individual_count += 1
                 self.stdout.write(
                     self.style.SUCCESS(f'Generated individual report for {user.username}')
                 )
@@ -133,23 +153,19 @@ class Command(BaseCommand):
                     self.style.ERROR(f'Error generating report for {user.username}: {str(e)}')
                 )
         
+        individual_count = self._save_reports(saved_reports)
+        
         # Generate team reports for all domains
-        domains = Domain.objects.all()
-        team_count = 0
+        domains = Domain.objects.only('id', 'name').iterator(chunk_size=500)
+        saved_reports = []
+        existing_domain_ids = set(
+            existing_reports.filter(report_type='team').values_list('domain_id', flat=True)
+        )
         
         for domain in domains:
             try:
                 # Check if report already exists
-                existing = SavedReport.objects.filter(
-                    report_type='team',
-                    period_type=period_type,
-                    jalali_year=year,
-                    jalali_month=month,
-                    jalali_week=week,
-                    domain=domain
-                ).first()
-                
-                if existing:
+                if domain.id in existing_domain_ids:
                     self.stdout.write(
                         self.style.WARNING(f'Report already exists for domain {domain.name}, skipping...')
                     )
@@ -157,14 +173,14 @@ class Command(BaseCommand):
                 
                 # Generate report data
                 report_data = ReportService.generate_team_report(
-                    domain, period_type, year, month=month, week=week
+                    domain, period_type, year, month=month, week=week, date_range=date_range
                 )
                 
                 # Generate PDF
-                pdf_file = generate_report_pdf(report_data, report_type='team')
+                pdf_file = generate_report_pdf(report_data, report_type='team', assets=pdf_assets)
                 
-                # Create saved report
-                saved_report = SavedReport.objects.create(
+                # Store the PDF now and queue the row for the bulk INSERT
+                saved_report = SavedReport(
                     report_type='team',
                     period_type=period_type,
                     jalali_year=year,
@@ -173,16 +189,14 @@ class Command(BaseCommand):
                     domain=domain,
                     report_data=report_data
                 )
-                
-                # Save PDF file
                 pdf_filename = f"report_team_{domain.id}_{year}_{period_type}.pdf"
                 saved_report.pdf_file.save(
                     pdf_filename,
-                    ContentFile(pdf_file.read()),
-                    save=True
+                    File(pdf_file),
+                    save=False
                 )
+                saved_reports.append((saved_report, domain.name))
                 
-                team_count += 1
                 self.stdout.write(
                     self.style.SUCCESS(f'Generated team report for {domain.name}')
                 )
@@ -191,8 +205,44 @@ class Command(BaseCommand):
                     self.style.ERROR(f'Error generating report for {domain.name}: {str(e)}')
                 )
         
+        team_count = self._save_reports(saved_reports)
+        
         self.stdout.write(
             self.style.SUCCESS(
                 f'Successfully generated {individual_count} individual reports and {team_count} team reports'
             )
         )
+    
+    def _save_reports(self, saved_reports):
+        """
+        Insert the generated (saved_report, owner_name) pairs and return how
+        many rows were written.
+        """
+        if not saved_reports:
+            return 0
+        
+        try:
+            with transaction.atomic():
+                SavedReport.objects.bulk_create(
+                    [saved_report for saved_report, _ in saved_reports], batch_size=200
+                )
+            return len(saved_reports)
+        except Exception:
+            # One bad row fails the whole batch; retry row by row so the
+            # others are still saved and only the failures are reported
+            pass
+        
+        saved_count = 0
+        for saved_report, owner_name in saved_reports:
+            saved_report.pk = None
+            try:
+                with transaction.atomic():
+                    saved_report.save()
+                saved_count += 1
+            except Exception as e:
+                # Don't leave the PDF of an unsaved report behind in storage
+                saved_report.pdf_file.delete(save=False)
+                self.stdout.write(
+                    self.style.ERROR(f'Error saving report for {owner_name}: {str(e)}')
+                )
+        return saved_count
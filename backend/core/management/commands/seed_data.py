@@ -2,8 +2,11 @@
 Management command to seed the database with test data for report functionality.
 """
 from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
 from django.contrib.auth.models import User
+from django.db import connection, transaction
 from django.utils import timezone
+from collections import defaultdict
 from datetime import timedelta, date, datetime
 import random
 import jdatetime
@@ -13,8 +16,8 @@ from core.models import (
     ReportNote, SavedReport, StatusChoices, ReportResultChoices, FeedbackTypeChoices,
     MeetingTypeChoices, RecurrenceTypeChoices
 )
-from accounts.models import UserProfile
-from core.jalali_utils import gregorian_to_jalali, jalali_to_gregorian
+from accounts.models import UserProfile, UserSession
+from core.jalali_utils import gregorian_to_jalali, jalali_to_gregorian, get_jalali_week_number
 
 
 class Command(BaseCommand):
@@ -30,54 +33,61 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         if options['flush']:
             self.stdout.write(self.style.WARNING('Flushing database...'))
-            # Delete in reverse dependency order
-            ReportNote.objects.all().delete()
-            SavedReport.objects.all().delete()
-            Report.objects.all().delete()
-            WorkingDay.objects.all().delete()
-            Feedback.objects.all().delete()
-            Meeting.objects.all().delete()
-            Task.objects.all().delete()
-            Project.objects.all().delete()
-            UserProfile.objects.all().delete()
-            # Delete all users (including superusers) - they will be recreated
-            User.objects.all().delete()
-            Domain.objects.all().delete()
+            # Empty the tables with the backend's flush SQL (a single TRUNCATE
+            # ... CASCADE on PostgreSQL) instead of having the ORM load and
+            # cascade every row in Python. Delete signals and model delete()
+            # overrides are not run. Tables with an FK to these are emptied
+            # too; UserSession has no DB-level constraint so it is listed.
+            # All users (including superusers) are removed and recreated below.
+            models = [
+                ReportNote, SavedReport, Report, WorkingDay, Feedback, Meeting,
+                Task, Project, UserProfile, UserSession, User, Domain,
+            ]
+            sql_list = connection.ops.sql_flush(
+                no_style(),
+                [model._meta.db_table for model in models],
+                reset_sequences=True,
+                allow_cascade=True,
+            )
+            connection.ops.execute_sql_flush(sql_list)
             self.stdout.write(self.style.SUCCESS('Database flushed.'))
 
         self.stdout.write(self.style.SUCCESS('Starting to seed data...'))
 
-        # Create domains
-        domains = self.create_domains()
-        self.stdout.write(self.style.SUCCESS(f'Created {len(domains)} domains.'))
+        # Seed in one transaction: rows are committed together rather than one
+        # autocommit per statement, and a failure leaves no half-seeded data
+        with transaction.atomic():
+            # Create domains
+            domains = self.create_domains()
+            self.stdout.write(self.style.SUCCESS(f'Created {len(domains)} domains.'))
 
-        # Create users
-        users = self.create_users(domains)
-        self.stdout.write(self.style.SUCCESS(f'Created {len(users)} users.'))
+            # Create users
+            users = self.create_users(domains)
+            self.stdout.write(self.style.SUCCESS(f'Created {len(users)} users.'))
 
-        # Create projects
-        projects = self.create_projects(domains, users)
-        self.stdout.write(self.style.SUCCESS(f'Created {len(projects)} projects.'))
+            # Create projects
+            projects = self.create_projects(domains, users)
+            self.stdout.write(self.style.SUCCESS(f'Created {len(projects)} projects.'))
 
-        # Create tasks
-        tasks = self.create_tasks(projects, users, domains)
-        self.stdout.write(self.style.SUCCESS(f'Created {len(tasks)} tasks.'))
+            # Create tasks
+            tasks = self.create_tasks(projects, users, domains)
+            self.stdout.write(self.style.SUCCESS(f'Created {len(tasks)} tasks.'))
 
-        # Create working days and reports
-        working_days, reports = self.create_working_days_and_reports(users, tasks)
-        self.stdout.write(self.style.SUCCESS(f'Created {len(working_days)} working days and {len(reports)} reports.'))
+            # Create working days and reports
+            working_days, reports = self.create_working_days_and_reports(users, tasks)
+            self.stdout.write(self.style.SUCCESS(f'Created {len(working_days)} working days and {len(reports)} reports.'))
 
-        # Create meetings
-        meetings = self.create_meetings(users)
-        self.stdout.write(self.style.SUCCESS(f'Created {len(meetings)} meetings.'))
+            # Create meetings
+            meetings = self.create_meetings(users)
+            self.stdout.write(self.style.SUCCESS(f'Created {len(meetings)} meetings.'))
 
-        # Create feedbacks
-        feedbacks = self.create_feedbacks(users)
-        self.stdout.write(self.style.SUCCESS(f'Created {len(feedbacks)} feedbacks.'))
+            # Create feedbacks
+            feedbacks = self.create_feedbacks(users)
+            self.stdout.write(self.style.SUCCESS(f'Created {len(feedbacks)} feedbacks.'))
 
-        # Create report notes
-        report_notes = self.create_report_notes(users, domains)
-        self.stdout.write(self.style.SUCCESS(f'Created {len(report_notes)} report notes.'))
+            # Create report notes
+            report_notes = self.create_report_notes(users, domains)
+            self.stdout.write(self.style.SUCCESS(f'Created {len(report_notes)} report notes.'))
 
         self.stdout.write(self.style.SUCCESS('Data seeding completed successfully!'))
 
@@ -125,7 +135,6 @@ class Command(BaseCommand):
         admin.set_password('admin123')
         admin.save()
         admin.profile.domain = domains[0]  # Tech domain
-        admin.profile.save()
         users.append(admin)
         
         # Regular users
@@ -149,14 +158,17 @@ class Command(BaseCommand):
             user.set_password('test123')
             user.save()
             user.profile.domain = domain
-            user.profile.save()
             users.append(user)
         
+        # Write every profile's domain in one UPDATE
+        UserProfile.objects.bulk_update([user.profile for user in users], ['domain'])
+        
         return users
 
     def create_projects(self, domains, users):
         """Create projects"""
         projects = []
+        project_assignees = []
         
         project_data = [
             ('پروژه وب سایت', 'توسعه وب سایت جدید', '#FF5733', domains[0], [users[1], users[2]], 'doing'),
@@ -177,14 +189,20 @@ class Command(BaseCommand):
                 estimated_hours=random.randint(100, 500),
                 status=status
             )
-            project.assignees.set(assignees)
+            project_assignees.extend(
+                Project.assignees.through(project_id=project.id, user_id=user.id) for user in assignees
+            )
             projects.append(project)
         
+        # Link all assignees in one INSERT instead of a set() per project
+        Project.assignees.through.objects.bulk_create(project_assignees)
+        
         return projects
 
     def create_tasks(self, projects, users, domains):
         """Create tasks (both draft and approved)"""
         tasks = []
+        task_assignees = []
         
         # Approved tasks (assigned to projects)
         task_data = [
@@ -209,7 +227,7 @@ class Command(BaseCommand):
                 is_draft=is_draft,
                 status=status
             )
-            task.assignees.set([assignee])
+            task_assignees.append(Task.assignees.through(task_id=task.id, user_id=assignee.id))
             tasks.append(task)
         
         # Draft tasks (created by users)
@@ -228,9 +246,12 @@ class Command(BaseCommand):
                 status=status,
                 is_draft=is_draft
             )
-            task.assignees.set([assignee])
+            task_assignees.append(Task.assignees.through(task_id=task.id, user_id=assignee.id))
             tasks.append(task)
         
+        # Link all assignees in one INSERT instead of a set() per task
+        Task.assignees.through.objects.bulk_create(task_assignees)
+        
         return tasks
 
     def create_working_days_and_reports(self, users, tasks):
@@ -242,8 +263,20 @@ class Command(BaseCommand):
         # Get current Jalali date
         jalali_now = gregorian_to_jalali(now.date())
         
+        # Index task assignments once instead of querying every task's
+        # assignees for every user and day
+        assigned_task_ids = defaultdict(set)
+        assignments = Task.assignees.through.objects.filter(task__in=tasks).values_list('user_id', 'task_id')
+        for user_id, task_id in assignments:
+            assigned_task_ids[user_id].add(task_id)
+        
         # Create working days for the last 2 weeks and current week
         for user in users[1:]:  # Skip admin
+            user_tasks = [
+                t for t in tasks
+                if t.id in assigned_task_ids[user.id] or t.created_by_id == user.id
+            ]
+            
             # Create working days for last 14 days (some weekdays)
             for day_offset in range(-14, 1):
                 # Skip some days randomly (not all users work every day)
@@ -253,7 +286,7 @@ class Command(BaseCommand):
                     
                     # Skip weekends (optional, can remove)
                     if check_in_time.weekday() < 5:  # Monday to Friday
-                        working_day = WorkingDay.objects.create(
+                        working_day = WorkingDay(
                             user=user,
                             check_in=check_in_time,
                             check_out=check_out_time,
@@ -263,7 +296,6 @@ class Command(BaseCommand):
                         
                         # Create 1-3 reports per working day
                         num_reports = random.randint(1, 3)
-                        user_tasks = [t for t in tasks if user in t.assignees.all() or (t.created_by == user)]
                         
                         if user_tasks:
                             selected_tasks = random.sample(user_tasks, min(num_reports, len(user_tasks)))
@@ -293,7 +325,7 @@ class Command(BaseCommand):
                                     ReportResultChoices.POSTPONED.value,
                                 ])
                                 
-                                report = Report.objects.create(
+                                report = Report(
                                     working_day=working_day,
                                     task=task,
                                     result=result,
@@ -309,11 +341,17 @@ class Command(BaseCommand):
                                 )
                                 reports.append(report)
         
+        # Insert everything in batches; the reports pick up their working
+        # day's primary key once the working days have been inserted
+        WorkingDay.objects.bulk_create(working_days, batch_size=500)
+        Report.objects.bulk_create(reports, batch_size=1000)
+        
         return working_days, reports
 
     def create_meetings(self, users):
         """Create meetings"""
         meetings = []
+        meeting_participants = []
         admin = users[0]
         
         now = timezone.now()
@@ -331,7 +369,9 @@ class Command(BaseCommand):
             )
             # Add some participants
             participants = random.sample(users[1:], random.randint(2, len(users)-1))
-            meeting.participants.set(participants)
+            meeting_participants.extend(
+                Meeting.participants.through(meeting_id=meeting.id, user_id=user.id) for user in participants
+            )
             meetings.append(meeting)
         
         # Future meetings (scheduled)
@@ -349,9 +389,14 @@ class Command(BaseCommand):
                 created_by=admin
             )
             participants = random.sample(users[1:], random.randint(2, len(users)-1))
-            meeting.participants.set(participants)
+            meeting_participants.extend(
+                Meeting.participants.through(meeting_id=meeting.id, user_id=user.id) for user in participants
+            )
             meetings.append(meeting)
         
+        # Link all participants in one INSERT instead of a set() per meeting
+        Meeting.participants.through.objects.bulk_create(meeting_participants)
+        
         return meetings
 
     def create_feedbacks(self, users):
@@ -386,12 +431,13 @@ class Command(BaseCommand):
         admin = users[0]
         now = timezone.now()
         jalali_now = gregorian_to_jalali(now.date())
+        current_week = get_jalali_week_number(jalali_now['year'], jalali_now['month'], jalali_now['day'])
         
         # Create notes for current week
         note = ReportNote.objects.create(
             period_type='weekly',
             jalali_year=jalali_now['year'],
-            jalali_week=self._get_current_jalali_week(jalali_now['year'], jalali_now['month'], jalali_now['day']),
+            jalali_week=current_week,
             note='یادداشت هفتگی: پیشرفت خوبی در پروژه‌ها داشتیم',
             domain=None,  # Global note
             created_by=admin
@@ -403,7 +449,7 @@ class Command(BaseCommand):
             note = ReportNote.objects.create(
                 period_type='weekly',
                 jalali_year=jalali_now['year'],
-                jalali_week=self._get_current_jalali_week(jalali_now['year'], jalali_now['month'], jalali_now['day']),
+                jalali_week=current_week,
                 note='یادداشت تیم توسعه: نیاز به تمرکز بیشتر',
                 domain=domains[3],  # dev_team
                 created_by=admin
@@ -411,9 +457,3 @@ class Command(BaseCommand):
             report_notes.append(note)
         
         return report_notes
-
-    def _get_current_jalali_week(self, year, month, day):
-        """Helper to get current Jalali week number"""
-        from core.jalali_utils import get_jalali_week_number
-        return get_jalali_week_number(year, month, day)
-
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_remove_savedreport_unique_saved_report_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reportnote',
+            index=models.Index(fields=['period_type', 'jalali_year', 'jalali_month', 'jalali_week'], name='core_report_period__d58676_idx'),
+        ),
+    ]
@@ -385,6 +385,10 @@ class ReportNote(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Period lookup used when building reports; domain has its own FK index
+            models.Index(fields=['period_type', 'jalali_year', 'jalali_month', 'jalali_week']),
+        ]
 
     def __str__(self):
         period_str = f"{self.jalali_year}"
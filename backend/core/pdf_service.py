@@ -50,13 +50,30 @@ def _ensure_vazir_font():
     return font_file
 
 
-def generate_report_pdf(report_data, report_type='individual'):
+def get_pdf_assets():
+    """
+    Prepare the stylesheet and font base URL shared by every report PDF.
+    
+    Returns:
+        Tuple of (CSS stylesheet, base_url or None)
+    """
+    font_file = _ensure_vazir_font()
+    # Set base_url to font directory so WeasyPrint can resolve font paths in CSS
+    base_url = None
+    if font_file and font_file.exists():
+        base_url = str(font_file.parent.absolute().as_uri())
+    return _build_pdf_css(font_file), base_url
+
+
+def generate_report_pdf(report_data, report_type='individual', assets=None):
     """
     Generate PDF from report data.
     
     Args:
         report_data: Dictionary containing report data (from report_service)
         report_type: 'individual' or 'team'
+        assets: (stylesheet, base_url) from get_pdf_assets(), to reuse them
+            across several PDFs
     
     Returns:
         BytesIO object containing PDF data
@@ -66,15 +83,9 @@ def generate_report_pdf(report_data, report_type='individual'):
     
     # Generate PDF
     pdf_file = BytesIO()
-    css = get_pdf_css()
+    css, base_url = assets or get_pdf_assets()
     
     try:
-        # Set base_url to font directory so WeasyPrint can resolve font paths in CSS
-        font_file_obj = _ensure_vazir_font()
-        base_url = None
-        if font_file_obj and font_file_obj.exists():
-            base_url = str(font_file_obj.parent.absolute().as_uri())
-        
         html_obj = HTML(string=html_content, base_url=base_url) if base_url else HTML(string=html_content)
         html_obj.write_pdf(pdf_file, stylesheets=[css])
         pdf_file.seek(0)
@@ -234,8 +245,11 @@ def build_report_html(report_data, report_type):
 def get_pdf_css():
     """Get CSS styles for PDF"""
     # Try to ensure font is available locally
-    font_file = _ensure_vazir_font()
-    
+    return _build_pdf_css(_ensure_vazir_font())
+
+
+def _build_pdf_css(font_file):
+    """Build the PDF stylesheet for the given local font file (or None)"""
     # Build font-face declaration  
     if font_file and font_file.exists():
         # Use relative path - will be resolved via base_url in HTML
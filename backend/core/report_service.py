@@ -18,7 +18,7 @@ class ReportService:
     """Service for generating individual and team reports"""
     
     @staticmethod
-    def generate_individual_report(user, period_type, year, month=None, day=None, week=None):
+    def generate_individual_report(user, period_type, year, month=None, day=None, week=None, date_range=None):
         """
         Generate report for an individual user.
         
@@ -29,12 +29,13 @@ class ReportService:
             month: Jalali month (for daily, monthly)
             day: Jalali day (for daily)
             week: Jalali week number (for weekly)
+            date_range: Precomputed (start_datetime, end_datetime) for the period
         
         Returns:
             Dictionary containing all report data
         """
         # Get date range
-        start_datetime, end_datetime = get_jalali_date_range(
+        start_datetime, end_datetime = date_range or get_jalali_date_range(
             period_type, year, month=month, day=day, week=week
         )
         
@@ -193,7 +194,7 @@ class ReportService:
         }
     
     @staticmethod
-    def generate_team_report(domain, period_type, year, month=None, week=None):
+    def generate_team_report(domain, period_type, year, month=None, week=None, date_range=None):
         """
         Generate report for a team/domain.
         
@@ -204,12 +205,13 @@ class ReportService:
             month: Jalali month (for daily, monthly)
             week: Jalali week number (for weekly)
             day: Not used for team reports (daily team reports not typical)
+            date_range: Precomputed (start_datetime, end_datetime) for the period
         
         Returns:
             Dictionary containing all report data
         """
         # Get date range
-        start_datetime, end_datetime = get_jalali_date_range(
+        start_datetime, end_datetime = date_range or get_jalali_date_range(
             period_type, year, month=month, week=week
         )
         
@@ -124,6 +124,22 @@ class TestDomainUtils:
         assert project_root not in filtered
         assert project_child2 not in filtered
     
+    def test_filter_by_domain_uses_single_query(self, regular_user, django_assert_num_queries):
+        """Test that domain filtering runs as a subquery instead of fetching descendant IDs first"""
+        root = Domain.objects.create(name='Root')
+        child = Domain.objects.create(name='Child', parent=root)
+        sibling = Domain.objects.create(name='Sibling')
+        Project.objects.create(name='Project Root', domain=root)
+        Project.objects.create(name='Project Child', domain=child)
+        Project.objects.create(name='Project Sibling', domain=sibling)
+        regular_user.profile.domain = root
+        regular_user.profile.save()
+        
+        with django_assert_num_queries(1):
+            names = set(filter_by_domain(Project.objects.all(), regular_user).values_list('name', flat=True))
+        
+        assert names == {'Project Root', 'Project Child'}
+    
     def test_filter_by_domain_user_no_domain(self, regular_user):
         """Test that users without domain see nothing"""
         domain = Domain.objects.create(name='Domain')
@@ -0,0 +1,142 @@
+"""
+Tests for the generate_saved_reports management command
+"""
+import pytest
+from io import BytesIO, StringIO
+from django.contrib.auth.models import User
+from django.core.management import call_command, CommandError
+
+from core.models import SavedReport, Domain
+from core.management.commands import generate_saved_reports
+from core.jalali_utils import get_jalali_date_range
+
+
+@pytest.fixture
+def stub_report_generation(monkeypatch, settings, tmp_path):
+    """Replace report building and PDF rendering with cheap stand-ins"""
+    settings.MEDIA_ROOT = str(tmp_path)
+    monkeypatch.setattr(
+        generate_saved_reports.ReportService, 'generate_individual_report',
+        lambda user, *args, **kwargs: {'user': user.username}
+    )
+    monkeypatch.setattr(
+        generate_saved_reports.ReportService, 'generate_team_report',
+        lambda domain, *args, **kwargs: {'domain': domain.name}
+    )
+    monkeypatch.setattr(
+        generate_saved_reports, 'generate_report_pdf',
+        lambda report_data, report_type='individual', assets=None: BytesIO(b'%PDF-1.4 stub')
+    )
+    monkeypatch.setattr(generate_saved_reports, 'get_pdf_assets', lambda: (None, None))
+
+
+@pytest.mark.django_db
+class TestGenerateSavedReportsCommand:
+    """Tests for generate_saved_reports"""
+    
+    def test_generates_missing_reports_and_skips_existing(self, stub_report_generation):
+        """Test that only owners without a report for the period get one"""
+        existing_user = User.objects.create_user(username='existing', password='password123')
+        new_user = User.objects.create_user(username='new', password='password123')
+        existing_domain = Domain.objects.create(name='Existing Domain')
+        new_domain = Domain.objects.create(name='New Domain')
+        period = {'period_type': 'monthly', 'jalali_year': 1403, 'jalali_month': 5, 'jalali_week': None}
+        SavedReport.objects.create(report_type='individual', user=existing_user, report_data={}, **period)
+        SavedReport.objects.create(report_type='team', domain=existing_domain, report_data={}, **period)
+        
+        call_command('generate_saved_reports', period_type='monthly', year=1403, month=5, stdout=StringIO())
+        
+        individual = SavedReport.objects.filter(report_type='individual', **period)
+        team = SavedReport.objects.filter(report_type='team', **period)
+        assert set(individual.values_list('user_id', flat=True)) == {existing_user.id, new_user.id}
+        assert set(team.values_list('domain_id', flat=True)) == {existing_domain.id, new_domain.id}
+        assert individual.get(user=new_user).pdf_file.read() == b'%PDF-1.4 stub'
+    
+    def test_rerun_for_same_period_creates_nothing(self, stub_report_generation, django_assert_max_num_queries):
+        """Test that a repeat run checks existing reports without a query per owner"""
+        for index in range(5):
+            User.objects.create_user(username=f'user{index}', password='password123')
+            Domain.objects.create(name=f'Domain {index}')
+        call_command('generate_saved_reports', period_type='yearly', year=1402, stdout=StringIO())
+        assert SavedReport.objects.count() == 10
+        
+        with django_assert_max_num_queries(4):
+            call_command('generate_saved_reports', period_type='yearly', year=1402, stdout=StringIO())
+        
+        assert SavedReport.objects.count() == 10
+    
+    def test_period_range_and_pdf_assets_prepared_once(self, stub_report_generation, monkeypatch):
+        """Test that every report reuses one date range and one set of PDF assets"""
+        for index in range(3):
+            User.objects.create_user(username=f'user{index}', password='password123')
+        Domain.objects.create(name='Domain')
+        calls = []
+        monkeypatch.setattr(
+            generate_saved_reports.ReportService, 'generate_individual_report',
+            lambda user, *args, **kwargs: calls.append(kwargs['date_range']) or {}
+        )
+        monkeypatch.setattr(
+            generate_saved_reports.ReportService, 'generate_team_report',
+            lambda domain, *args, **kwargs: calls.append(kwargs['date_range']) or {}
+        )
+        asset_calls = []
+        monkeypatch.setattr(
+            generate_saved_reports, 'get_pdf_assets', lambda: asset_calls.append(1) or (None, None)
+        )
+        
+        call_command('generate_saved_reports', period_type='monthly', year=1403, month=5, stdout=StringIO())
+        
+        assert len(calls) == 4
+        assert calls == [get_jalali_date_range('monthly', 1403, month=5)] * 4
+        assert len(asset_calls) == 1
+    
+    def test_reports_are_inserted_in_bulk(self, stub_report_generation, django_assert_max_num_queries):
+        """Test that new reports are written with one INSERT per report type"""
+        for index in range(5):
+            User.objects.create_user(username=f'user{index}', password='password123')
+            Domain.objects.create(name=f'Domain {index}')
+        
+        # Users, domains and the two existing-report lookups, two INSERTs and a savepoint pair
+        # around each INSERT (the test runs inside a transaction)
+        with django_assert_max_num_queries(10):
+            call_command('generate_saved_reports', period_type='yearly', year=1402, stdout=StringIO())
+        
+        assert SavedReport.objects.filter(report_type='individual').count() == 5
+        assert SavedReport.objects.filter(report_type='team').count() == 5
+        assert all(report.created_at for report in SavedReport.objects.all())
+    
+    def test_failed_insert_only_drops_that_report(self, stub_report_generation, monkeypatch, tmp_path):
+        """Test that a report whose row can't be saved is skipped, reported and its PDF removed"""
+        good_user = User.objects.create_user(username='good', password='password123')
+        bad_user = User.objects.create_user(username='bad', password='password123')
+        monkeypatch.setattr(
+            generate_saved_reports.ReportService, 'generate_individual_report',
+            # A set is not JSON serializable, so only the bad user's INSERT fails
+            lambda user, *args, **kwargs: {'tags': {1}} if user == bad_user else {}
+        )
+        stdout = StringIO()
+        
+        call_command('generate_saved_reports', period_type='yearly', year=1402, stdout=stdout)
+        
+        individual = SavedReport.objects.filter(report_type='individual')
+        assert list(individual.values_list('user_id', flat=True)) == [good_user.id]
+        assert 'Error saving report for bad' in stdout.getvalue()
+        assert 'Successfully generated 1 individual reports' in stdout.getvalue()
+        stored = {path.name for path in (tmp_path / 'reports').iterdir()}
+        assert f'report_individual_{bad_user.id}_1402_yearly.pdf' not in stored
+        assert f'report_individual_{good_user.id}_1402_yearly.pdf' in stored
+    
+    def test_invalid_period_raises_command_error(self, stub_report_generation):
+        """Test that an invalid period is reported as a CommandError"""
+        with pytest.raises(CommandError, match='Invalid monthly period'):
+            call_command('generate_saved_reports', period_type='monthly', year=1403, month=13, stdout=StringIO())
+        assert not SavedReport.objects.exists()
+    
+    def test_missing_pdf_assets_raise_command_error(self, stub_report_generation, monkeypatch):
+        """Test that failing to load the PDF stylesheet and fonts is reported as a CommandError"""
+        def fail():
+            raise OSError('font directory is not writable')
+        monkeypatch.setattr(generate_saved_reports, 'get_pdf_assets', fail)
+        
+        with pytest.raises(CommandError, match='font directory is not writable'):
+            call_command('generate_saved_reports', period_type='yearly', year=1402, stdout=StringIO())
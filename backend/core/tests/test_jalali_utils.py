@@ -15,6 +15,8 @@ from core.jalali_utils import (
     get_jalali_month_start_end,
     get_jalali_year_start_end,
     get_jalali_date_range,
+    get_jalali_month_length,
+    is_jalali_leap_year,
     format_jalali_period,
 )
 
@@ -98,6 +100,13 @@ class TestGetJalaliWeekNumber:
         week = get_jalali_week_number(1403, 12, 29)
         assert isinstance(week, int)
         assert week > 0
+    
+    def test_get_jalali_week_number_invalid_date(self):
+        """Test that impossible dates raise ValueError"""
+        with pytest.raises(ValueError):
+            get_jalali_week_number(1404, 12, 30)  # 1404 is not a leap year
+        with pytest.raises(ValueError):
+            get_jalali_week_number(1403, 13, 1)
 
 
 class TestGetJalaliWeekStartEnd:
@@ -165,6 +174,25 @@ class TestGetJalaliMonthStartEnd:
         days_diff = (end.date() - start.date()).days
         assert days_diff == 28  # 29 days total, so 28 days difference
     
+    def test_get_jalali_month_length(self):
+        """Test month lengths, including Esfand in leap and common years"""
+        assert is_jalali_leap_year(1403) is True
+        assert is_jalali_leap_year(1404) is False
+        assert get_jalali_month_length(1404, 1) == 31
+        assert get_jalali_month_length(1404, 7) == 30
+        assert get_jalali_month_length(1403, 12) == 30
+        assert get_jalali_month_length(1404, 12) == 29
+    
+    def test_get_jalali_month_start_end_follows_active_timezone(self):
+        """Test that cached boundaries are still made aware in the active timezone"""
+        with timezone.override('UTC'):
+            utc_start, _ = get_jalali_month_start_end(1404, 1)
+        with timezone.override('Asia/Tehran'):
+            tehran_start, _ = get_jalali_month_start_end(1404, 1)
+        
+        assert utc_start.date() == tehran_start.date()
+        assert utc_start != tehran_start
+    
     def test_get_jalali_month_start_end_invalid_month(self):
         """Test that invalid months raise ValueError"""
         with pytest.raises(ValueError):
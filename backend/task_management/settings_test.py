@@ -0,0 +1,26 @@
+"""
+Django settings for running the test suite.
+
+Extends the development settings with speed-ups that are only safe in tests.
+"""
+
+import os
+
+from .settings import *
+
+# PBKDF2 is deliberately slow and every user fixture hashes a password;
+# MD5 is insecure but fine for throwaway test users
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+]
+
+# TEST_DB=sqlite runs the suite against an in-memory SQLite database, which
+# needs no running PostgreSQL server; CI leaves it unset so the tests still
+# cover PostgreSQL
+if os.getenv('TEST_DB') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': ':memory:',
+        }
+    }